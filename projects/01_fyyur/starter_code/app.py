@@ -2,20 +2,41 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import io
 import json
-from datetime import datetime
+import math
+import base64
+import hashlib
+import time
+import uuid
+from datetime import datetime, timezone
+from functools import lru_cache
+from itertools import groupby
 import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import babel.dates
+import click
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify, \
+  get_flashed_messages, stream_with_context, session
 from flask_moment import Moment
+from flask.json import JSONEncoder
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func
+from sqlalchemy import func, tuple_, cast, false, event, DDL
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
 from sqlalchemy.exc import SQLAlchemyError
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from cache import make_cache
+from importer import read_rows, validate_row, BatchInserter
+from pool import TimedQueuePool
+from jobs import WriteQueue
+
+try:
+  from query_profiler import QueryProfiler
+except ImportError:
+  QueryProfiler = None
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -23,15 +44,52 @@ from forms import *
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
+app.config.from_object('config.%sConfig' % app.config['PROFILE'].capitalize())
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(app.config['SQLALCHEMY_ENGINE_OPTIONS'], poolclass=TimedQueuePool)
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
+cache = make_cache(app.config)
+write_queue = WriteQueue(app, db, cache, app.config['WRITE_QUEUE_WORKERS'], app.config['JOB_RESULT_TTL'])
+if QueryProfiler is not None:
+  QueryProfiler(app)
+
+class ISOJSONEncoder(JSONEncoder):
+    # Dates go out as ISO 8601 rather than Flask's HTTP date format
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+app.json_encoder = ISOJSONEncoder
 
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+# City and state pairs, lower-cased and trimmed, that venues and artists
+# point at. Location searches match this small table and then follow the
+# indexed location_id columns.
+class Location(db.Model):
+    __tablename__ = 'Location'
+    __table_args__ = (
+        db.UniqueConstraint('city', 'state', name='uq_Location_city_state'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
+
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_Venue_city_state', 'state', 'city', 'id'),
+        db.Index('ix_Venue_location_id', 'location_id'),
+        # GiST on the point, so a bounding box bounds latitude and longitude
+        # at once (see venues_near)
+        db.Index('ix_Venue_location_point', db.text('point(longitude, latitude)'),
+                 postgresql_using='gist'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -39,51 +97,149 @@ class Venue(db.Model):
     state = db.Column(db.String(120))
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String))
+    genres = db.Column(ARRAY(db.String))
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(240))
     facebook_link = db.Column(db.String(240))
     image_link = db.Column(db.String(240))
     website = db.Column(db.String(240))
-    show = db.relationship('Show', backref=db.backref('Venue', lazy=True))
+    location_id = db.Column(db.Integer, db.ForeignKey('Location.id'))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    show = db.relationship('Show', backref=db.backref('Venue', lazy=True), passive_deletes=True)
 
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_Artist_city_state', 'state', 'city', 'id'),
+        db.Index('ix_Artist_name_id', 'name', 'id'),
+        db.Index('ix_Artist_location_id', 'location_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String))
+    genres = db.Column(ARRAY(db.String))
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(240))
     facebook_link = db.Column(db.String(240))
     image_link = db.Column(db.String(240))
     website = db.Column(db.String(240))
-    show = db.relationship('Show', backref=db.backref('Artist', lazy=True))
+    location_id = db.Column(db.Integer, db.ForeignKey('Location.id'))
+    show = db.relationship('Show', backref=db.backref('Artist', lazy=True), passive_deletes=True)
 
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
     start_time = db.Column(db.DateTime)
 
+# Show counts and times per venue and per artist, kept up to date by the
+# controllers that write shows; a venue or artist without shows has no row.
+# "flask roll-shows" moves shows that have started from upcoming to past.
+class VenueShowSummary(db.Model):
+    __tablename__ = 'VenueShowSummary'
+    __table_args__ = (
+        db.Index('ix_VenueShowSummary_next_show_time', 'next_show_time'),
+    )
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0)
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0)
+    next_show_time = db.Column(db.DateTime)
+    last_show_time = db.Column(db.DateTime)
+
+class ArtistShowSummary(db.Model):
+    __tablename__ = 'ArtistShowSummary'
+    __table_args__ = (
+        db.Index('ix_ArtistShowSummary_next_show_time', 'next_show_time'),
+    )
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0)
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0)
+    next_show_time = db.Column(db.DateTime)
+    last_show_time = db.Column(db.DateTime)
+
+# Summary model for each of Show's venue_id and artist_id columns
+SHOW_SUMMARIES = {
+    'venue_id': VenueShowSummary,
+    'artist_id': ArtistShowSummary,
+}
+
+# Write log per table, which the JSON API's ETags are built from. A statement
+# trigger on Venue, Artist and Show appends a row in the writing
+# transaction, so every worker sees the writes of the others, of the CLI and
+# of plain SQL once they commit. Writers only insert, so they never wait on
+# each other; the trigger trims each table's log to its last entries.
+class DataVersion(db.Model):
+    __tablename__ = 'DataVersion'
+    __table_args__ = (
+        db.Index('ix_DataVersion_table_name_id', 'table_name', 'id'),
+    )
+    id = db.Column(db.BigInteger, primary_key=True)
+    table_name = db.Column(db.String(120), nullable=False)
+
+VERSIONED_TABLES = ('Venue', 'Artist', 'Show')
+
+BUMP_DATA_VERSION = '''
+CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+DECLARE
+  entry bigint;
+BEGIN
+  INSERT INTO "DataVersion" (table_name) VALUES (TG_TABLE_NAME) RETURNING id INTO entry;
+  IF mod(entry, 1000) = 0 THEN
+    DELETE FROM "DataVersion" WHERE table_name = TG_TABLE_NAME AND id < entry - 1000;
+  END IF;
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+'''
+
+DATA_VERSION_TRIGGER = '''
+DROP TRIGGER IF EXISTS "{0}_data_version" ON "{0}";
+CREATE TRIGGER "{0}_data_version"
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "{0}"
+FOR EACH STATEMENT EXECUTE PROCEDURE bump_data_version()
+'''
+
+# db.create_all() installs them as the migration does
+event.listen(db.metadata, 'after_create', DDL(BUMP_DATA_VERSION).execute_if(dialect='postgresql'))
+for table_name in VERSIONED_TABLES:
+  event.listen(db.metadata, 'after_create',
+    DDL(DATA_VERSION_TRIGGER.format(table_name)).execute_if(dialect='postgresql'))
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  res = 'bar'
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en_US')
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+@lru_cache(maxsize=None)
+def datetime_pattern(format, locale):
+  # Babel pattern and locale objects, parsed once per format and locale
+  return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+@lru_cache(maxsize=4096)
+def format_datetime(value, format='medium', locale='en_US'):
+  # Accepts datetimes as they come from the database, and strings for
+  # anything else; listings repeat start times often, hence the memo
+  if not isinstance(value, datetime):
+    value = dateutil.parser.parse(value)
+  pattern, locale = datetime_pattern(format, locale)
+  return pattern.apply(value, locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
@@ -93,9 +249,32 @@ app.jinja_env.filters['datetime'] = format_datetime
 
 @app.route('/')
 def index():
-  recent_artists = Artist.query.order_by(db.desc(Artist.id)).limit(10)
-  recent_venues = Venue.query.order_by(db.desc(Venue.id)).limit(10)
-  return render_template('pages/home.html', artists=recent_artists, venues=recent_venues)
+  data = cache.get('home')
+  if data is None:
+    data = refresh_recent_listings()
+  return render_template('pages/home.html', artists=data['artists'], venues=data['venues'])
+
+def refresh_recent_listings():
+  # Recomputes the homepage's 10 most recent artists and venues and stores
+  # them in the cache, so page views do not touch the database
+  data = {
+    'artists': [{
+      'id': a.id,
+      'name': a.name,
+      'image_link': a.image_link,
+    } for a in recent_listings_query(Artist)],
+    'venues': [{
+      'id': v.id,
+      'name': v.name,
+      'image_link': v.image_link,
+    } for v in recent_listings_query(Venue)],
+  }
+  cache.set('home', data, app.config['HOME_CACHE_TTL'])
+  return data
+
+def recent_listings_query(model):
+  # the 10 most recently created artists or venues
+  return db.session.query(model.id, model.name, model.image_link).order_by(db.desc(model.id)).limit(10)
 
 def format_boolean(value):
     # Formatting value to the expected type
@@ -103,87 +282,502 @@ def format_boolean(value):
     # and False as None
     return value == 'y'
 
+def show_rows(*criteria):
+  # Shows matching the criteria along with the artist and venue
+  # columns the pages need, fetched in a single joined query. Shows
+  # without a start time are left out, as they are neither past nor
+  # upcoming and cannot be paged by time.
+  return db.session.query(
+      Show.id,
+      Show.start_time,
+      Show.venue_id,
+      Venue.name.label('venue_name'),
+      Venue.image_link.label('venue_image_link'),
+      Show.artist_id,
+      Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link'),
+    ).join(Venue, Show.venue_id == Venue.id) \
+    .join(Artist, Show.artist_id == Artist.id) \
+    .filter(Show.start_time.isnot(None), *criteria) \
+    .order_by(Show.start_time, Show.id)
+
+def format_show(row):
+  return {
+    "venue_id": row.venue_id,
+    "venue_name": row.venue_name,
+    "venue_image_link": row.venue_image_link,
+    "artist_id": row.artist_id,
+    "artist_name": row.artist_name,
+    "artist_image_link": row.artist_image_link,
+    "start_time": row.start_time
+  }
+
+def show_filters(args):
+  # Server-side filters for show listings: ?when=past|upcoming and
+  # an optional ?start=...&end=... date range
+  now = datetime.utcnow()
+  criteria = []
+  when = args.get('when')
+  if when == 'upcoming':
+    criteria.append(Show.start_time > now)
+  elif when == 'past':
+    criteria.append(Show.start_time < now)
+  try:
+    if args.get('start'):
+      criteria.append(Show.start_time >= dateutil.parser.parse(args['start']))
+    if args.get('end'):
+      criteria.append(Show.start_time < dateutil.parser.parse(args['end']))
+  except (ValueError, OverflowError):
+    abort(400)
+  return criteria
+
+def encode_cursor(*values):
+  # Opaque pagination token for the last row of a page
+  raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+  return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(token, parse_key=dateutil.parser.parse):
+  # (key, id) from a token made by encode_cursor; the key is a show's
+  # start time unless another parse_key is given
+  try:
+    key, row_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+    return parse_key(key), int(row_id)
+  except (ValueError, TypeError, AttributeError):
+    abort(400)
+
+def keyset_page(rows, per_page, pager, format_row, cursor_of):
+  # Yields up to per_page formatted rows from rows fetched with one extra
+  # row; pager['next_cursor'] is set once the page has been read, which is
+  # before the template reaches its "Next page" link
+  last = None
+  for index, row in enumerate(rows):
+    if index == per_page:
+      pager['next_cursor'] = encode_cursor(*cursor_of(last))
+      break
+    last = row
+    yield format_row(row)
+
+def escape_like(search_term):
+  # Escapes LIKE wildcards so the term is matched literally
+  return search_term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+_trigram_support = {}
+
+def trigram_search_enabled():
+  # pg_trgm backs ILIKE '%term%' with a GIN index and provides similarity()
+  # for ranking; on a Postgres server without the extension searches are
+  # unindexed ILIKE scans ranked with plain SQL
+  url = str(db.engine.url)
+  if url not in _trigram_support:
+    _trigram_support[url] = db.session.execute(
+      "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'").scalar() is not None
+  return _trigram_support[url]
+
+def search_by_name(model, search_term):
+  # Case-insensitive partial match on name with the best matches first,
+  # capped at SEARCH_RESULTS_LIMIT rows; each row also carries the total
+  # number of matches so the count needs no second query
+  term = escape_like(search_term)
+  if trigram_search_enabled():
+    rank = [func.similarity(model.name, search_term).desc()]
+  else:
+    rank = [db.case([
+        (func.lower(model.name) == search_term.lower(), 0),
+        (model.name.ilike(f'{term}%', escape='\\'), 1),
+      ], else_=2), func.length(model.name)]
+  return db.session.query(model.id, model.name, func.count().over().label('total')) \
+    .filter(model.name.ilike(f'%{term}%', escape='\\')) \
+    .order_by(*rank, model.name, model.id) \
+    .limit(app.config['SEARCH_RESULTS_LIMIT'])
+
+def genre_criteria(model, genres, match_all):
+  # rows tagged with every genre (@>) or any genre (&&), both answered by
+  # the GIN index on genres
+  if not genres:
+    return false()
+  genres = cast(genres, ARRAY(db.String))
+  return model.genres.contains(genres) if match_all else model.genres.overlap(genres)
+
+def search_by_genres(model, genres, match_all, page):
+  # One page of the rows tagged with the genres
+  per_page = app.config['SEARCH_RESULTS_LIMIT']
+  return db.session.query(model.id, model.name) \
+    .filter(genre_criteria(model, genres, match_all)) \
+    .order_by(model.name, model.id) \
+    .limit(per_page) \
+    .offset((page - 1) * per_page)
+
+def count_by_genres(model, genres, match_all):
+  # The number of rows tagged with the genres on every page, counted apart
+  # from the page so a page past the last row of model still reports it
+  return db.session.query(func.count(model.id)) \
+    .filter(genre_criteria(model, genres, match_all))
+
+def upcoming_show_counts(column, ids):
+  # Upcoming show counts for a batch of venue or artist ids, keyed by id,
+  # where column is Show.venue_id or Show.artist_id
+  if not ids:
+    return {}
+  return dict(upcoming_show_counts_query(column, ids).all())
+
+def upcoming_show_counts_query(column, ids):
+  # primary key lookups in the show summary of the venues or artists
+  summary = SHOW_SUMMARIES[column.key]
+  key = getattr(summary, column.key)
+  return db.session.query(key, summary.upcoming_shows_count).filter(key.in_(ids))
+
+def record_show(venue_id, artist_id, start_time):
+  # Counts a new show in the summaries of its venue and artist, in the
+  # caller's transaction; LEAST/GREATEST skip the NULL times
+  upcoming = start_time > datetime.utcnow()
+  for key, id in (('venue_id', venue_id), ('artist_id', artist_id)):
+    table = SHOW_SUMMARIES[key].__table__
+    insert = pg_insert(table).values({
+      key: id,
+      'upcoming_shows_count': 1 if upcoming else 0,
+      'past_shows_count': 0 if upcoming else 1,
+      'next_show_time': start_time if upcoming else None,
+      'last_show_time': None if upcoming else start_time,
+    })
+    db.session.execute(insert.on_conflict_do_update(index_elements=[key], set_={
+      'upcoming_shows_count': table.c.upcoming_shows_count + insert.excluded.upcoming_shows_count,
+      'past_shows_count': table.c.past_shows_count + insert.excluded.past_shows_count,
+      'next_show_time': func.least(table.c.next_show_time, insert.excluded.next_show_time),
+      'last_show_time': func.greatest(table.c.last_show_time, insert.excluded.last_show_time),
+    }))
+
+def refresh_show_summaries(column, ids=None):
+  # Recomputes the summaries of the given venue or artist ids (all when
+  # ids is None) from the Show table with one INSERT ... SELECT, and drops
+  # the rows of those left without shows; runs in the caller's transaction
+  summary = SHOW_SUMMARIES[column.key]
+  table = summary.__table__
+  key = table.c[column.key]
+  now = datetime.utcnow()
+  # the INSERT ... SELECT below does not autoflush pending shows
+  db.session.flush()
+  stats = db.session.query(
+      column,
+      func.count(Show.id).filter(Show.start_time > now),
+      func.count(Show.id).filter(Show.start_time <= now),
+      func.min(Show.start_time).filter(Show.start_time > now),
+      func.max(Show.start_time).filter(Show.start_time <= now),
+    ).group_by(column)
+  stale = db.session.query(summary).filter(~db.session.query(Show.id).filter(column == key).exists())
+  if ids is not None:
+    if not ids:
+      return
+    stats = stats.filter(column.in_(ids))
+    stale = stale.filter(key.in_(ids))
+  columns = [column.key, 'upcoming_shows_count', 'past_shows_count', 'next_show_time', 'last_show_time']
+  insert = pg_insert(table).from_select(columns, stats)
+  db.session.execute(insert.on_conflict_do_update(index_elements=[column.key], set_={
+    name: insert.excluded[name] for name in columns[1:]}))
+  stale.delete(synchronize_session=False)
+
+def roll_show_summaries():
+  # Recomputes the summaries whose next show has started, moving it from
+  # upcoming to past; returns how many were updated
+  now = datetime.utcnow()
+  rolled = 0
+  for key, summary in SHOW_SUMMARIES.items():
+    due = [id for (id,) in db.session.query(getattr(summary, key)).filter(summary.next_show_time <= now)]
+    refresh_show_summaries(getattr(Show, key), due)
+    rolled += len(due)
+  db.session.commit()
+  return rolled
+
+def search_response(results, column, count):
+  counts = upcoming_show_counts(column, [r.id for r in results])
+  return {
+    "count": count,
+    "data": [{
+      "id": r.id,
+      "name": r.name,
+      "num_upcoming_shows": counts.get(r.id, 0),
+    } for r in results]
+  }
+
+def assign_locations(model, ids=None):
+  # Points venues or artists at the Location row for their city and state,
+  # adding the rows missing from Location first. Covers the given ids, or
+  # every row without a location_id yet (e.g. after an import)
+  db.session.flush()
+  city, state = func.lower(func.trim(model.city)), func.lower(func.trim(model.state))
+  pending = model.location_id.is_(None) if ids is None else model.id.in_(ids)
+  db.session.execute(pg_insert(Location.__table__).from_select(['city', 'state'],
+    db.select([city, state]).where(db.and_(pending, model.city.isnot(None), model.state.isnot(None)))
+      .distinct()).on_conflict_do_nothing())
+  location = db.select([Location.id]).where(db.and_(Location.city == city, Location.state == state))
+  db.session.execute(model.__table__.update().where(pending).values(location_id=location.as_scalar()))
+
+def location_ids(search_term):
+  # Locations matching "City, ST" on both parts, or a term without a comma
+  # on either the city or the state; partial and case-insensitive
+  city, comma, state = (part.strip().lower() for part in search_term.partition(','))
+  contains = lambda column, term: column.like('%' + escape_like(term) + '%', escape='\\')
+  if comma:
+    criteria = [contains(Location.city, city), contains(Location.state, state)]
+  else:
+    criteria = [db.or_(contains(Location.city, city), contains(Location.state, city))]
+  return db.session.query(Location.id).filter(*criteria)
+
+def search_by_location(model, search_term):
+  # Capped at SEARCH_RESULTS_LIMIT rows, each carrying the total number of
+  # matches like search_by_name
+  return db.session.query(model.id, model.name, func.count().over().label('total')) \
+    .filter(model.location_id.in_(location_ids(search_term).subquery())) \
+    .order_by(model.name, model.id) \
+    .limit(app.config['SEARCH_RESULTS_LIMIT'])
+
+EARTH_RADIUS_MILES = 3958.8
+
+def venues_near(latitude, longitude, miles):
+  # Venues within miles of a point, nearest first. The bounding box around
+  # the point is searched through the GiST index on point(longitude,
+  # latitude), then the haversine distance is computed only for the venues
+  # inside it
+  degrees = math.degrees(miles / EARTH_RADIUS_MILES)
+  south, north = latitude - degrees, latitude + degrees
+  lon_delta = degrees / max(math.cos(math.radians(latitude)), 0.01)
+  west, east = longitude - lon_delta, longitude + lon_delta
+  if lon_delta >= 180:
+    boxes = [(-180, 180)]
+  elif west < -180 or east > 180:
+    # the box crosses the antimeridian: two longitude ranges
+    boxes = [((west + 540) % 360 - 180, 180), (-180, (east + 540) % 360 - 180)]
+  else:
+    boxes = [(west, east)]
+  point = func.point(Venue.longitude, Venue.latitude)
+  box = db.or_(*[point.op('<@')(func.box(func.point(low, south), func.point(high, north)))
+                 for low, high in boxes])
+
+  lat1, lon1 = math.radians(latitude), math.radians(longitude)
+  lat2, lon2 = func.radians(Venue.latitude), func.radians(Venue.longitude)
+  haversine = func.power(func.sin((lat2 - lat1) / 2), 2) + \
+    math.cos(lat1) * func.cos(lat2) * func.power(func.sin((lon2 - lon1) / 2), 2)
+  distance = 2 * EARTH_RADIUS_MILES * func.asin(func.least(func.sqrt(haversine), 1))
+  nearby = db.session.query(Venue.id, Venue.name, distance.label('distance')).filter(box).subquery()
+  return db.session.query(nearby).filter(nearby.c.distance <= miles) \
+    .order_by(nearby.c.distance, nearby.c.id) \
+    .limit(app.config['SEARCH_RESULTS_LIMIT'])
+
+def delete_with_shows(model, column, ids):
+  # Deletes venues or artists and their shows with two set-based DELETEs in
+  # one transaction; the explicit show DELETE keeps the count and still
+  # works where the ON DELETE CASCADE foreign keys are not migrated yet
+  other = Show.artist_id if column.key == 'venue_id' else Show.venue_id
+  others = [id for (id,) in db.session.query(other).filter(column.in_(ids)).distinct()]
+  shows_deleted = Show.query.filter(column.in_(ids)).delete(synchronize_session=False)
+  # drops the summaries of the deleted rows and recomputes those of the
+  # artists or venues they had shows with
+  refresh_show_summaries(column, ids)
+  refresh_show_summaries(other, others)
+  deleted = model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+  db.session.commit()
+  return deleted, shows_deleted
+
+def batch_delete(model, column):
+  # Ids come as repeated "ids" form fields or a JSON body {"ids": [...]}
+  json_body = request.get_json(silent=True)
+  if json_body is None:
+    ids = request.form.getlist('ids')
+    if not all(id.isdigit() for id in ids):
+      abort(400)
+    ids = [int(id) for id in ids]
+  else:
+    if not isinstance(json_body, dict):
+      abort(400)
+    ids = json_body.get('ids')
+    # a list of whole numbers: a string would be read digit by digit, and
+    # int() would also take true or 1.5
+    if not isinstance(ids, list) or not all(
+        isinstance(id, int) and not isinstance(id, bool) for id in ids):
+      abort(400)
+  if not ids:
+    abort(400)
+
+  try:
+    deleted, shows_deleted = delete_with_shows(model, column, ids)
+  except SQLAlchemyError:
+    db.session.rollback()
+    abort(500)
+  invalidate_listings(model, Show)
+  return jsonify({
+    'success': True,
+    'deleted': deleted,
+    'shows_deleted': shows_deleted,
+  })
+
+def invalidate_listings(*models):
+  # Drops the cached homepage once venues, artists or shows have changed;
+  # the listing snapshots follow the data versions instead
+  cache.delete('home')
+
+def data_versions(models):
+  # Versions of the models' tables from their write logs, read with one
+  # index scan. The count and sum of the entries change with every commit,
+  # including those that commit out of id order; a table without entries
+  # counts as 0
+  names = [model.__tablename__ for model in models]
+  versions = {name: '%d.%d' % (count, total) for name, count, total in
+    db.session.query(DataVersion.table_name, func.count(), func.sum(DataVersion.id))
+      .filter(DataVersion.table_name.in_(names)).group_by(DataVersion.table_name)}
+  return [versions.get(name, '0') for name in names]
+
+def snapshot_key(name, models):
+  # Cache key of a listing snapshot built from the models' tables. It holds
+  # their data versions, so a write made through any worker moves every
+  # worker to a new snapshot, as it moves them to a new ETag.
+  return ':'.join([name] + data_versions(models))
+
+def wants_json():
+  # ?format=json, or an Accept header that prefers JSON to HTML
+  if request.args.get('format') == 'json':
+    return True
+  return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
+def json_response(models, build, timed=False):
+  # JSON variant of a read view. The ETag is made of the data versions of
+  # the tables the view reads, plus the current ETAG_TIME_BUCKET for views
+  # that split shows into past and upcoming, so a matching If-None-Match is
+  # answered with 304 after reading the versions, before build() runs
+  parts = data_versions(models)
+  if timed:
+    parts.append(str(int(time.time() // app.config['ETAG_TIME_BUCKET'])))
+  etag = hashlib.md5(':'.join(parts).encode()).hexdigest()
+  if request.if_none_match.contains_weak(etag):
+    response = Response(status=304)
+  else:
+    response = jsonify(build())
+  response.set_etag(etag)
+  response.vary.add('Accept')
+  return response
+
+def stream_rows(query):
+  # Reads the query through a server-side cursor, STREAM_BATCH_SIZE rows at
+  # a time, instead of loading the whole result first
+  return query.yield_per(app.config['STREAM_BATCH_SIZE'])
+
+def stream_template(template_name, **context):
+  # Renders the template while it is being sent, so the rows behind a lazy
+  # context value are written out as they are fetched. Flashed messages are
+  # popped up front: the session cookie is sent before the body.
+  get_flashed_messages()
+  app.update_template_context(context)
+  template = app.jinja_env.get_template(template_name)
+  return Response(stream_with_context(template.generate(context)))
+
+def split_shows(rows):
+  # Splits show rows into (past, upcoming) in a single pass
+  now = datetime.utcnow()
+  past, upcoming = [], []
+  for row in rows:
+    if row.start_time > now:
+      upcoming.append(format_show(row))
+    elif row.start_time < now:
+      past.append(format_show(row))
+  return past, upcoming
+
+def submit_write(write, *args):
+  # Runs a write in the request, or hands it to the background write queue
+  # when WRITE_QUEUE is set. Either way its message is flashed; a queued
+  # write's on the first request after it has finished.
+  if not app.config['WRITE_QUEUE']:
+    try:
+      succeeded, message = write(*args)
+    except Exception:
+      # as on the write queue: the error is logged, and the submission
+      # still redirects with a message instead of failing the request
+      app.logger.exception('write %s failed', write.__name__)
+      db.session.rollback()
+      message = 'An error occurred. Your changes could not be saved.'
+    flash(message)
+    return
+  job_id = write_queue.submit(write, *args)
+  session['pending_jobs'] = session.get('pending_jobs', []) + [job_id]
+
+@app.before_request
+def flash_finished_jobs():
+  pending = session.get('pending_jobs')
+  if not pending:
+    return
+  waiting = []
+  for job_id in pending:
+    job = write_queue.status(job_id)
+    if job is None:
+      continue
+    if job['status'] in ('queued', 'running'):
+      waiting.append(job_id)
+    else:
+      flash(job['message'])
+  if waiting != pending:
+    session['pending_jobs'] = waiting
+
 #----------------------------------------------------------------------------#
 #  Venues
 #----------------------------------------------------------------------------#
 
 @app.route('/venues')
 def venues():
-  areas = db.session.query(Venue.city, Venue.state).group_by(Venue.city, Venue.state)
-  data = [{
-    "city": a.city,
-    "state": a.state,
-    "venues": [{
-      "name": v.name,
-      } for v in db.session.query(Venue.id, Venue.name).filter_by(city=a.city, state=a.state).all()]
-    } for a in areas]
-  s = Show.query
-
-  return render_template('pages/venues.html', areas=data);
+  if wants_json():
+    return json_response((Venue, Show), lambda: {'areas': venue_listing()}, timed=True)
+  if app.config['STREAM_LISTINGS']:
+    return stream_template('pages/venues.html', areas=venue_areas(stream_rows(venue_areas_query())))
+  return render_template('pages/venues.html', areas=venue_listing())
+
+def venue_listing():
+  key = snapshot_key('venues', (Venue, Show))
+  data = cache.get(key)
+  if data is None:
+    data = [dict(area, venues=list(area['venues'])) for area in venue_areas(venue_areas_query())]
+    if app.config['VENUES_CACHE_TTL']:
+      cache.set(key, data, app.config['VENUES_CACHE_TTL'])
+  return data
+
+def venue_areas(rows):
+  # Groups venue rows, ordered by area, into one entry per city and state.
+  # Entries are produced lazily so a streamed page never holds every venue;
+  # each area's venues must be read before moving on to the next area
+  for (city, state), area in groupby(rows, key=lambda r: (r.city, r.state)):
+    yield {
+      "city": city,
+      "state": state,
+      "venues": ({
+        "id": v.id,
+        "name": v.name,
+        "num_upcoming_shows": v.num_upcoming_shows,
+      } for v in area)
+    }
+
+def venue_areas_query():
+  return db.session.query(
+      Venue.id,
+      Venue.name,
+      Venue.city,
+      Venue.state,
+      func.coalesce(VenueShowSummary.upcoming_shows_count, 0).label('num_upcoming_shows')
+    ).outerjoin(VenueShowSummary, VenueShowSummary.venue_id == Venue.id) \
+    .order_by(Venue.state, Venue.city, Venue.id)
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
   search_term = request.form.get('search_term', '')
 
-  res = Venue.query.filter(Venue.name.ilike(f'%{search_term}%')).all()
-  count = len(res)
-
-  response={
-    "count": count,
-    "data": [{
-      "id": r.id,
-      "name": r.name,
-      "num_upcoming_shows": 0,
-    } for r in res]
-  }
+  res = search_by_name(Venue, search_term).all()
+  response = search_response(res, Show.venue_id, res[0].total if res else 0)
   return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
+  if wants_json():
+    return json_response((Venue, Show, Artist), lambda: venue_details(venue_id) or abort(404), timed=True)
   try:
-    venue = Venue.query.get(venue_id)
-
-    upcoming_shows =  Show.query.filter(Show.start_time > datetime.utcnow(), Show.venue_id==venue_id).all()
-    past_shows =  Show.query.filter(Show.start_time < datetime.utcnow(), Show.venue_id==venue_id).all()
-
-    upcoming_shows_data = [{
-      "venue_id": s.venue_id,
-      "venue_name": Venue.query.get(s.venue_id).name,
-      "artist_id": s.artist_id,
-      "artist_name": Artist.query.get(s.artist_id).name,
-      "artist_image_link": Artist.query.get(s.artist_id).image_link,
-      "start_time": s.start_time
-      } for s in upcoming_shows]
-
-    past_shows_data = [{
-      "venue_id": s.venue_id,
-      "venue_name": Venue.query.get(s.venue_id).name,
-      "artist_id": s.artist_id,
-      "artist_name": Artist.query.get(s.artist_id).name,
-      "artist_image_link": Artist.query.get(s.artist_id).image_link,
-      "start_time": s.start_time.strftime("%m/%d/%Y, %H:%M")
-      } for s in past_shows]
-
-    data = {
-        "id": venue.id,
-        "name": venue.name,
-        "city": venue.city,
-        "state": venue.state,
-        "phone": venue.phone,
-        "genres": venue.genres,
-        "seeking_talent": venue.seeking_talent,
-        "seeking_description": venue.seeking_description,
-        "image_link": venue.image_link,
-        "facebook_link": venue.facebook_link,
-        "website": venue.website,
-        "upcoming_shows_count": len(upcoming_shows_data),
-        "upcoming_shows": upcoming_shows_data,
-        "past_shows_count": len(past_shows_data),
-        "past_shows": past_shows_data
-    }
-    print('AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA')
-    print(data)
+    data = venue_details(venue_id)
+    if data is None:
+      data = {}
+      flash('Venue could not be found!')
 
   except SQLAlchemyError as e:
     data = {}
@@ -193,6 +787,30 @@ def show_venue(venue_id):
   finally:
     return render_template('pages/show_venue.html', venue=data)
 
+def venue_details(venue_id):
+  # The venue with its shows split into past and upcoming, or None
+  venue = Venue.query.get(venue_id)
+  if venue is None:
+    return None
+  past_shows_data, upcoming_shows_data = split_shows(show_rows(Show.venue_id == venue_id))
+  return {
+    "id": venue.id,
+    "name": venue.name,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "genres": venue.genres,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link,
+    "facebook_link": venue.facebook_link,
+    "website": venue.website,
+    "upcoming_shows_count": len(upcoming_shows_data),
+    "upcoming_shows": upcoming_shows_data,
+    "past_shows_count": len(past_shows_data),
+    "past_shows": past_shows_data
+  }
+
 #----------------------------------------------------------------------------#
 #  Create Venue
 #----------------------------------------------------------------------------#
@@ -205,190 +823,217 @@ def create_venue_form():
 @app.route('/venues/create', methods=['POST'])
 def create_venue_submission():
   # called upon submitting the new venue listing form
+  data = {
+    'name': request.form.get('name'),
+    'city': request.form.get('city'),
+    'state': request.form.get('state'),
+    'address': request.form.get('address'),
+    'phone': request.form.get('phone'),
+    'latitude': coordinate('latitude', 90),
+    'longitude': coordinate('longitude', 180),
+    'genres': request.form.getlist('genres'),
+    'seeking_talent': format_boolean(request.form.get('seeking_talent')),
+    'seeking_description': request.form.get('seeking_description', ''),
+    'facebook_link': request.form.get('facebook_link'),
+    'image_link': request.form.get('image_link'),
+    'website': request.form.get('website'),
+  }
+  submit_write(save_new_venue, data)
+  return redirect(url_for('index'))
 
+def save_new_venue(data):
   try:
-    name = request.form.get('name')
-    city = request.form.get('city')
-    state = request.form.get('state')
-    address = request.form.get('address')
-    phone = request.form.get('phone')
-    genres = request.form.getlist('genres')
-    seeking_talent = request.form.get('seeking_talent')
-    seeking_description = request.form.get('seeking_description', '')
-    facebook_link = request.form.get('facebook_link')
-    image_link = request.form.get('image_link')
-    website = request.form.get('website')
-
-    seeking_talent = format_boolean(seeking_talent)
-
-    venue = Venue(name=name, city=city, state=state, address=address, phone=phone, genres=genres, seeking_talent=seeking_talent, seeking_description=seeking_description, facebook_link= facebook_link, image_link=image_link, website=website)
+    venue = Venue(**data)
     db.session.add(venue)
+    db.session.flush()
+    assign_locations(Venue, [venue.id])
     db.session.commit()
-
-    # on successful db insert, flash success
-    flash('Venue ' + request.form.get('name') + ' was successfully listed!')
+    invalidate_listings(Venue)
+    refresh_recent_listings()
+    return True, 'Venue ' + str(data['name']) + ' was successfully listed!'
   except SQLAlchemyError as e:
     db.session.rollback()
-    flash('An error occurred. Venue ' + name + ' could not be listed.')
-  finally:
-    db.session.close()
-    return redirect(url_for('index'))
+    return False, 'An error occurred. Venue ' + str(data['name']) + ' could not be listed.'
 
 @app.route('/venues/<int:venue_id>/delete', methods=['DELETE', 'POST'])
 def delete_venue(venue_id):
   try:
-    venue = db.session.query(Venue).filter(Venue.id==venue_id).first()
-    shows = db.session.query(Show).filter(Show.venue_id==venue_id).all()
-
-    for show in shows:
-      db.session.delete(show)
-      
-    db.session.delete(venue)
-
-    db.session.commit()
-    flash('Venue ' + venue.name + ' deleted successfully!')
+    name = db.session.query(Venue.name).filter(Venue.id==venue_id).scalar()
+    deleted, shows_deleted = delete_with_shows(Venue, Show.venue_id, [venue_id])
+
+    invalidate_listings(Venue, Show)
+    refresh_recent_listings()
+    if deleted:
+      flash('Venue ' + str(name) + ' deleted successfully!')
+    else:
+      flash('Venue could not be found!')
   except SQLAlchemyError as e:
     error = str(e.__dict__['orig'])
     print(error)
     db.session.rollback()
     flash('An error occurred. Venue could not be deleted.')
   finally:
-    db.session.close()
     return redirect(url_for('index'))
 
-
+@app.route('/venues/delete', methods=['DELETE', 'POST'])
+def delete_venues():
+  return batch_delete(Venue, Show.venue_id)
 
 #----------------------------------------------------------------------------#
 #  Artists
 #----------------------------------------------------------------------------#
 @app.route('/artists')
 def artists():
+  # displays a page of artists ordered by name. ?after= continues from a
+  # (name, id) cursor, ?letter= starts at the first name from that letter
+  # and ?page= jumps to a page number by offset, which is only cheap for
+  # the first pages
+  per_page = app.config['ARTISTS_PER_PAGE']
+  cursor = request.args.get('after')
+  rows = artist_page_query(per_page, decode_cursor(cursor, str) if cursor else None,
+    request.args.get('letter', '')[:1], max(request.args.get('page', 1, type=int), 1))
+  pager = {'next_cursor': None}
+
+  if wants_json():
+    def build():
+      data = list(artist_page(rows, per_page, pager))
+      return {'artists': data, 'next_cursor': pager['next_cursor'], 'letters': artist_letters(),
+        'approximate_total': approximate_count(Artist)}
+    return json_response((Artist,), build)
+
+  pager.update(letters=artist_letters(), approximate_total=approximate_count(Artist))
+  if app.config['STREAM_LISTINGS']:
+    return stream_template('pages/artists.html', artists=artist_page(stream_rows(rows), per_page, pager),
+      pager=pager)
+  data = list(artist_page(rows, per_page, pager))
+  return render_template('pages/artists.html', artists=data, pager=pager)
+
+def artist_page_query(per_page, after=None, letter='', page=1):
+  # per_page + 1 artists in name order, so the caller can tell whether
+  # there is a next page
+  query = db.session.query(Artist.id, Artist.name).order_by(Artist.name, Artist.id)
+  if after:
+    query = query.filter(tuple_(Artist.name, Artist.id) > after)
+  elif letter:
+    query = query.filter(Artist.name >= letter)
+  elif page > 1:
+    query = query.offset((page - 1) * per_page)
+  return query.limit(per_page + 1)
+
+def artist_page(rows, per_page, pager):
+  return keyset_page(rows, per_page, pager, format_artist, lambda a: (a.name, a.id))
+
+def format_artist(row):
+  return {
+    "id": row.id,
+    "name": row.name
+  }
 
-  artists = db.session.query(Artist.id, Artist.name).all()
-  data = [{
-    "id": a.id,
-    "name": a.name
-    } for a in artists]
-  return render_template('pages/artists.html', artists=data)
+def artist_letters():
+  # A-Z jump table: the number of artists per first letter of their name,
+  # from one GROUP BY. It reads every name, so it is cached until artists
+  # change or ARTIST_INDEX_CACHE_TTL passes
+  key = snapshot_key('artist_letters', (Artist,))
+  letters = cache.get(key)
+  if letters is None:
+    letters = [{'letter': letter, 'count': count} for letter, count in artist_letters_query()]
+    cache.set(key, letters, app.config['ARTIST_INDEX_CACHE_TTL'])
+  return letters
+
+def artist_letters_query():
+  initial = func.upper(func.substr(Artist.name, 1, 1))
+  return db.session.query(initial, func.count()).group_by(initial).order_by(initial)
+
+def approximate_count(model):
+  # Row estimate kept in pg_class by ANALYZE and autovacuum, read instead
+  # of a COUNT(*) that would scan the table; None when the table has not
+  # been analyzed yet or the database keeps no such statistics
+  if db.engine.dialect.name != 'postgresql':
+    return None
+  estimate = db.session.execute("SELECT reltuples FROM pg_class WHERE oid = CAST(:table AS regclass)",
+    {'table': '"%s"' % model.__tablename__}).scalar()
+  return int(estimate) if estimate is not None and estimate >= 0 else None
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
   search_term = request.form.get('search_term', '')
 
-  res = Artist.query.filter(Artist.name.ilike(f'%{search_term}%')).all()
-  count = len(res)
-
-  response={
-    "count": count,
-    "data": [{
-      "id": r.id,
-      "name": r.name,
-      "num_upcoming_shows": 0,
-    } for r in res]
-  }
+  res = search_by_name(Artist, search_term).all()
+  response = search_response(res, Show.artist_id, res[0].total if res else 0)
   return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 @app.route('/tags/search', methods=['POST'])
 def search_tags():
+  # Several genres can be given as repeated "genres" fields or as a comma
+  # separated search_term; match=any switches from AND to OR semantics
   search_term = request.form.get('search_term', '')
-  artists = Artist.query.filter(Artist.genres.any(search_term)).all()
-  count = len(artists)
-  
-  artists_response={
-    "count": count,
-    "data": [{
-      "id": a.id,
-      "name": a.name,
-      "num_upcoming_shows": 0,
-    } for a in artists]
-  }
+  genres = [g for g in request.form.getlist('genres') if g] or \
+    [g.strip() for g in search_term.split(',') if g.strip()]
+  match_all = request.form.get('match', 'all') != 'any'
+  page = request.form.get('page', 1, type=int)
+  if page < 1:
+    abort(400)
 
-  venues = Venue.query.filter(Venue.genres.any(search_term)).all()
-  count = len(venues)
-  venues_response={
-    "count": count,
-    "data": [{
-      "id": v.id,
-      "name": v.name,
-      "num_upcoming_shows": 0,
-    } for v in venues]
-  }
-  return render_template('pages/search_tags.html', artists=artists_response, venues=venues_response, search_term=search_term)
+  artists = search_by_genres(Artist, genres, match_all, page).all()
+  artists_response = search_response(artists, Show.artist_id,
+    count_by_genres(Artist, genres, match_all).scalar())
+
+  venues = search_by_genres(Venue, genres, match_all, page).all()
+  venues_response = search_response(venues, Show.venue_id,
+    count_by_genres(Venue, genres, match_all).scalar())
+
+  per_page = app.config['SEARCH_RESULTS_LIMIT']
+  has_next = page * per_page < max(artists_response['count'], venues_response['count'])
+  return render_template('pages/search_tags.html', artists=artists_response, venues=venues_response,
+    search_term=', '.join(genres), genres=genres, match='all' if match_all else 'any',
+    page=page, has_next=has_next)
 
 
 @app.route('/search', methods=['POST'])
 def search_location():
+  # "San Francisco, CA" matches city and state, "San Francisco" or "CA"
+  # alone matches either
   search_term = request.form.get('search_term', '')
-  tokens = search_term.split(',')
-
-  city = tokens[0]
-  state = tokens[1][1:] # removes the extra space between the comma and the state
-  
-  artists = Artist.query.filter(Artist.city.ilike(f'%{city}%'), Artist.state.ilike(f'%{state}%')).all()
-  count = len(artists) 
-  artists_response={
-    "count": count,
-    "data": [{
-      "id": a.id,
-      "name": a.name,
-    } for a in artists]
-  }
 
-  venues = Venue.query.filter(Venue.city.ilike(f'%{city}%'), Venue.state.ilike(f'%{state}%')).all()
-  count = len(venues)
-  venues_response={
-    "count": count,
-    "data": [{
-      "id": v.id,
-      "name": v.name,
-    } for v in venues]
-  }
+  artists = search_by_location(Artist, search_term).all()
+  artists_response = search_response(artists, Show.artist_id, artists[0].total if artists else 0)
+
+  venues = search_by_location(Venue, search_term).all()
+  venues_response = search_response(venues, Show.venue_id, venues[0].total if venues else 0)
   return render_template('pages/search_location.html', artists=artists_response, venues=venues_response, search_term=search_term)
 
+@app.route('/venues/near')
+def search_venues_near():
+  # ?lat=&lon=&miles= lists the venues within miles of the point, nearest
+  # first; miles defaults to NEARBY_DEFAULT_MILES, at most NEARBY_MAX_MILES
+  latitude = request.args.get('lat', type=float)
+  longitude = request.args.get('lon', type=float)
+  miles = request.args.get('miles', app.config['NEARBY_DEFAULT_MILES'], type=float)
+  if latitude is None or longitude is None or not -90 <= latitude <= 90 or \
+      not -180 <= longitude <= 180 or not 0 < miles <= app.config['NEARBY_MAX_MILES']:
+    abort(400)
+
+  venues = [{
+    "id": v.id,
+    "name": v.name,
+    "distance": round(v.distance, 2),
+  } for v in venues_near(latitude, longitude, miles)]
+  if wants_json():
+    return jsonify({'count': len(venues), 'venues': venues})
+  return render_template('pages/search_location.html', artists={'count': 0, 'data': []},
+    venues={'count': len(venues), 'data': venues},
+    search_term='within {:g} miles of {:g}, {:g}'.format(miles, latitude, longitude))
+
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
-  
+  if wants_json():
+    return json_response((Artist, Show, Venue), lambda: artist_details(artist_id) or abort(404), timed=True)
   try:
-    artist = Artist.query.get(artist_id)
-    upcoming_shows =  Show.query.filter(Show.start_time > datetime.utcnow(), Show.artist_id==artist_id).all()
-    past_shows =  Show.query.filter(Show.start_time < datetime.utcnow(), Show.artist_id==artist_id).all()
-
-    upcoming_shows_data = [{
-      "venue_id": s.venue_id,
-      "venue_name": Venue.query.get(s.venue_id).name,
-      "venue_image_link": Venue.query.get(s.venue_id).image_link,
-      "artist_id": s.artist_id,
-      "artist_name": Artist.query.get(s.artist_id).name,
-      "start_time": s.start_time.strftime("%m/%d/%Y, %H:%M")
-      } for s in upcoming_shows]
-
-    past_shows_data = [{
-      "venue_id": s.venue_id,
-      "venue_name": Venue.query.get(s.venue_id).name,
-      "venue_image_link": Venue.query.get(s.venue_id).image_link,
-      "artist_id": s.artist_id,
-      "artist_name": Artist.query.get(s.artist_id).name,
-      "start_time": s.start_time.strftime("%m/%d/%Y, %H:%M")
-      } for s in past_shows]
-
-    data = {
-      "id": artist.id,
-      "name": artist.name,
-      "city": artist.city,
-      "state": artist.state,
-      "phone": artist.phone,
-      "genres": artist.genres,
-      "seeking_venue": artist.seeking_venue,
-      "seeking_description": artist.seeking_description,
-      "image_link": artist.image_link,
-      "facebook_link": artist.facebook_link,
-      "website": artist.website,
-      "upcoming_shows_count": len(upcoming_shows_data),
-      "upcoming_shows": upcoming_shows_data,
-      "past_shows_count": len(past_shows_data),
-      "past_shows": past_shows_data
-    }
+    data = artist_details(artist_id)
+    if data is None:
+      data = {}
+      flash('Artist could not be found!')
 
   except SQLAlchemyError as e:
     data = {}
@@ -396,31 +1041,64 @@ def show_artist(artist_id):
   finally:
     return render_template('pages/show_artist.html', artist=data)
 
+def artist_details(artist_id):
+  # The artist with its shows split into past and upcoming, or None
+  artist = Artist.query.get(artist_id)
+  if artist is None:
+    return None
+  past_shows_data, upcoming_shows_data = split_shows(show_rows(Show.artist_id == artist_id))
+  return {
+    "id": artist.id,
+    "name": artist.name,
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "genres": artist.genres,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "image_link": artist.image_link,
+    "facebook_link": artist.facebook_link,
+    "website": artist.website,
+    "upcoming_shows_count": len(upcoming_shows_data),
+    "upcoming_shows": upcoming_shows_data,
+    "past_shows_count": len(past_shows_data),
+    "past_shows": past_shows_data
+  }
+
 @app.route('/artists/<int:artist_id>/delete', methods=['DELETE', 'POST'])
 def delete_artist(artist_id):
   try:
-    artist = db.session.query(Artist).filter(Artist.id==artist_id).first()
-    shows = db.session.query(Show).filter(Show.artist_id==artist_id).all()
-
-    for show in shows:
-      db.session.delete(show)
-      
-    db.session.delete(artist)
-
-    db.session.commit()
-    flash('Artist ' + artist.name + ' deleted successfully!')
+    name = db.session.query(Artist.name).filter(Artist.id==artist_id).scalar()
+    deleted, shows_deleted = delete_with_shows(Artist, Show.artist_id, [artist_id])
+
+    invalidate_listings(Artist, Show)
+    refresh_recent_listings()
+    if deleted:
+      flash('Artist ' + str(name) + ' deleted successfully!')
+    else:
+      flash('Artist could not be found!')
   except SQLAlchemyError as e:
     error = str(e.__dict__['orig'])
     print(error)
     db.session.rollback()
     flash('An error occurred. Artist could not be deleted.')
   finally:
-    db.session.close()
     return redirect(url_for('index'))
+
+@app.route('/artists/delete', methods=['DELETE', 'POST'])
+def delete_artists():
+  return batch_delete(Artist, Show.artist_id)
+
 #----------------------------------------------------------------------------#
 #  Update
 #----------------------------------------------------------------------------#
 
+def coordinate(name, limit):
+  # Optional latitude or longitude field; a missing, malformed or out of
+  # range value is left out
+  value = request.form.get(name, type=float)
+  return value if value is not None and -limit <= value <= limit else None
+
 def change(current, new):
   if current != new and new:
     return new
@@ -438,29 +1116,38 @@ def edit_artist(artist_id):
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
+  data = {
+    'name': request.form.get('name'),
+    'city': request.form.get('city'),
+    'state': request.form.get('state'),
+    'phone': request.form.get('phone'),
+    'genres': request.form.getlist('genres'),
+    'seeking_venue': request.form.get('seeking_venue'),
+    'seeking_description': request.form.get('seeking_description'),
+    'website': request.form.get('website'),
+    'facebook_link': request.form.get('facebook_link'),
+    'image_link': request.form.get('image_link'),
+  }
+  submit_write(save_artist_changes, artist_id, data)
+  return redirect(url_for('show_artist', artist_id=artist_id))
+
+def save_artist_changes(artist_id, data):
   try:
     artist = Artist.query.get(artist_id)
+    if artist is None:
+      return False, 'Artist could not be found!'
+    for field, value in data.items():
+      setattr(artist, field, change(getattr(artist, field), value))
+    assign_locations(Artist, [artist_id])
 
-    artist.name = change(artist.name, request.form.get('name'))
-    artist.city = change(artist.city, request.form.get('city'))
-    artist.state = change(artist.state, request.form.get('state'))
-    artist.phone = change(artist.phone, request.form.get('phone'))
-    artist.genres = change(artist.genres, request.form.getlist('genres'))
-    artist.seeking_venue = change(artist.seeking_venue, request.form.get('seeking_venue'))
-    artist.seeking_description = change(artist.seeking_description, request.form.get('seeking_description'))
-    artist.website = change(artist.website, request.form.get('website'))
-    artist.facebook_link = change(artist.facebook_link, request.form.get('facebook_link'))
-    artist.image_link = change(artist.image_link, request.form.get('image_link'))
-    
     db.session.commit()
+    invalidate_listings(Artist)
+    return True, 'Artist ' + str(artist.name) + ' was successfully updated!'
   except SQLAlchemyError as e:
     error = str(e.__dict__['orig'])
     print(error)
     db.session.rollback()
-  finally:
-    db.session.close()
-
-  return redirect(url_for('show_artist', artist_id=artist_id))
+    return False, 'An error occurred. Artist could not be updated.'
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
@@ -474,31 +1161,39 @@ def edit_venue(venue_id):
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
+  data = {
+    'name': request.form.get('name'),
+    'city': request.form.get('city'),
+    'state': request.form.get('state'),
+    'address': request.form.get('address'),
+    'phone': request.form.get('phone'),
+    'latitude': coordinate('latitude', 90),
+    'longitude': coordinate('longitude', 180),
+    'genres': request.form.getlist('genres'),
+    'seeking_talent': format_boolean(request.form.get('seeking_talent')),
+    'seeking_description': request.form.get('seeking_description'),
+    'facebook_link': request.form.get('facebook_link'),
+    'image_link': request.form.get('image_link'),
+    'website': request.form.get('website'),
+  }
+  submit_write(save_venue_changes, venue_id, data)
+  return redirect(url_for('show_venue', venue_id=venue_id))
+
+def save_venue_changes(venue_id, data):
   try:
     venue = Venue.query.get(venue_id)
-
-    venue.name = change(venue.name, request.form.get('name'))
-    venue.city = change(venue.city, request.form.get('city'))
-    venue.state = change(venue.state, request.form.get('state'))
-    venue.address = change(venue.address, request.form.get('address'))
-    venue.phone = change(venue.phone, request.form.get('phone'))
-    venue.genres = change(venue.genres, request.form.getlist('genres'))
-
-    seeking_talent = format_boolean(request.form.get('seeking_talent'))
-    venue.seeking_talent = change(venue.seeking_talent, seeking_talent)
-    venue.seeking_description = change(venue.seeking_description, request.form.get('seeking_description'))
-    venue.facebook_link = change(venue.facebook_link, request.form.get('facebook_link'))
-    venue.image_link = change(venue.facebook_link, request.form.get('image_link'))
-    venue.website = change(venue.website, request.form.get('website'))
-
+    if venue is None:
+      return False, 'Venue could not be found!'
+    for field, value in data.items():
+      setattr(venue, field, change(getattr(venue, field), value))
+    assign_locations(Venue, [venue_id])
 
     db.session.commit()
+    invalidate_listings(Venue)
+    return True, 'Venue ' + str(venue.name) + ' was successfully updated!'
   except SQLAlchemyError as e:
     db.session.rollback()
-  finally:
-    db.session.close()
-
-  return redirect(url_for('show_venue', venue_id=venue_id))
+    return False, 'An error occurred. Venue could not be updated.'
 
 #----------------------------------------------------------------------------#
 #  Create Artist
@@ -512,34 +1207,34 @@ def create_artist_form():
 @app.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   # called upon submitting the new artist listing form
+  data = {
+    'name': request.form.get('name'),
+    'city': request.form.get('city'),
+    'state': request.form.get('state'),
+    'phone': request.form.get('phone'),
+    'genres': request.form.getlist('genres'),
+    'seeking_venue': format_boolean(request.form.get('seeking_venue')),
+    'seeking_description': request.form.get('seeking_description', ''),
+    'website': request.form.get('website', ''),
+    'facebook_link': request.form.get('facebook_link'),
+    'image_link': request.form.get('image_link'),
+  }
+  submit_write(save_new_artist, data)
+  return redirect(url_for('index'))
 
+def save_new_artist(data):
   try:
-    name = request.form.get('name')
-    city = request.form.get('city')
-    state = request.form.get('state')
-    phone = request.form.get('phone')
-    genres = request.form.getlist('genres')
-    seeking_venue = request.form.get('seeking_venue')
-    seeking_description = request.form.get('seeking_description', '')
-    website = request.form.get('website', '')
-    facebook_link = request.form.get('facebook_link')
-    image_link = request.form.get('image_link')
-
-    seeking_venue = format_boolean(seeking_venue)
-    
-    artist = Artist(name=name, city=city, state=state, phone=phone, genres=genres, seeking_venue=seeking_venue, seeking_description=seeking_description, website=website, facebook_link= facebook_link, image_link=image_link)
-
+    artist = Artist(**data)
     db.session.add(artist)
+    db.session.flush()
+    assign_locations(Artist, [artist.id])
     db.session.commit()
-
-    # on successful db insert, flash success
-    flash('Artist ' + request.form.get('name') + ' was successfully listed!')
+    invalidate_listings(Artist)
+    refresh_recent_listings()
+    return True, 'Artist ' + str(data['name']) + ' was successfully listed!'
   except SQLAlchemyError as e:
     db.session.rollback()
-    flash('An error occurred. Artist ' + name + ' could not be listed.')
-  finally:
-    db.session.close()
-    return redirect(url_for('index'))
+    return False, 'An error occurred. Artist ' + str(data['name']) + ' could not be listed.'
 
 #----------------------------------------------------------------------------#
 #  Shows
@@ -547,18 +1242,32 @@ def create_artist_submission():
 
 @app.route('/shows')
 def shows():
-  # displays list of shows at /shows
-  shows = db.session.query(Show).all()
-  data = [{
-    "venue_id": s.venue_id,
-    "venue_name": Venue.query.get(s.venue_id).name,
-    "artist_id": s.artist_id,
-    "artist_name": Artist.query.get(s.artist_id).name,
-    "artist_image_link": Artist.query.get(s.artist_id).image_link,
-    "start_time": s.start_time.strftime("%m/%d/%Y, %H:%M")
-    } for s in shows]
-
-  return render_template('pages/shows.html', shows=data)
+  # displays a page of shows at /shows, ordered by start time and paginated
+  # with a (start_time, id) cursor so a page costs the same wherever it is
+  criteria = show_filters(request.args)
+  cursor = request.args.get('after')
+  if cursor:
+    criteria.append(tuple_(Show.start_time, Show.id) > decode_cursor(cursor))
+
+  per_page = app.config['SHOWS_PER_PAGE']
+  rows = show_rows(*criteria).limit(per_page + 1)
+  pager = {'next_cursor': None}
+  filters = {key: value for key, value in request.args.items() if key != 'after'}
+
+  if wants_json():
+    def build():
+      data = list(show_page(rows, per_page, pager))
+      return {'shows': data, 'next_cursor': pager['next_cursor']}
+    return json_response((Show, Venue, Artist), build, timed='when' in request.args)
+
+  if app.config['STREAM_LISTINGS']:
+    return stream_template('pages/shows.html', shows=show_page(stream_rows(rows), per_page, pager),
+      pager=pager, filters=filters)
+  data = list(show_page(rows, per_page, pager))
+  return render_template('pages/shows.html', shows=data, pager=pager, filters=filters)
+
+def show_page(rows, per_page, pager):
+  return keyset_page(rows, per_page, pager, format_show, lambda s: (s.start_time, s.id))
 
 @app.route('/shows/create')
 def create_shows():
@@ -569,27 +1278,260 @@ def create_shows():
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
- 
   try:
-    artist_id = request.form.get('artist_id')
-    venue_id = request.form.get('venue_id')
-    start_time = request.form.get('start_time')
+    artist_id = int(request.form.get('artist_id'))
+    venue_id = int(request.form.get('venue_id'))
+    start_time = dateutil.parser.parse(request.form.get('start_time'))
+  except (TypeError, ValueError, OverflowError):
+    flash('Could not list show.')
+    return redirect(url_for('index'))
+  if start_time.tzinfo is not None:
+    # start times are stored and compared as naive UTC
+    start_time = start_time.astimezone(timezone.utc).replace(tzinfo=None)
+  submit_write(save_new_show, venue_id, artist_id, start_time)
+  return redirect(url_for('index'))
 
+def save_new_show(venue_id, artist_id, start_time):
+  try:
     show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time)
-
     db.session.add(show)
+    db.session.flush()
+    record_show(venue_id, artist_id, start_time)
     db.session.commit()
-
-    # on successful db insert, flash success
-    flash('Show was successfully listed!')
+    invalidate_listings(Show)
+    return True, 'Show was successfully listed!'
   except SQLAlchemyError as e:
     error = str(e.__dict__['orig'])
     print(error)
     db.session.rollback()
-    flash('Could not list show.')  
+    return False, 'Could not list show.'
+
+#----------------------------------------------------------------------------#
+#  Bulk import
+#----------------------------------------------------------------------------#
+
+IMPORTS = {
+  'venues': (Venue, VenueForm),
+  'artists': (Artist, ArtistForm),
+  'shows': (Show, ShowForm),
+}
+
+def missing_show_references(batch):
+  # Rejects shows whose venue or artist does not exist, with one id lookup
+  # per table for the whole batch instead of a failed INSERT
+  venue_ids = {values['venue_id'] for values in batch}
+  artist_ids = {values['artist_id'] for values in batch}
+  venues = {id for (id,) in db.session.query(Venue.id).filter(Venue.id.in_(venue_ids))}
+  artists = {id for (id,) in db.session.query(Artist.id).filter(Artist.id.in_(artist_ids))}
+  rejected = {}
+  for index, values in enumerate(batch):
+    if values['venue_id'] not in venues:
+      rejected[index] = {'venue_id': ['Venue does not exist.']}
+    elif values['artist_id'] not in artists:
+      rejected[index] = {'artist_id': ['Artist does not exist.']}
+  return rejected
+
+def import_rows(kind, stream, format, batch_size=None):
+  # Validates every row with the create form for its kind and inserts the
+  # valid ones in batches; invalid rows are reported, not fatal
+  model, form_class = IMPORTS[kind]
+  columns = [c for c in model.__table__.columns.keys() if c != 'id']
+  inserter = BatchInserter(db.session, model.__table__,
+    batch_size or app.config['IMPORT_BATCH_SIZE'],
+    check_batch=missing_show_references if model is Show else None)
+  show_ids = {'venue_id': set(), 'artist_id': set()}
+
+  for line, row, error in read_rows(stream, format):
+    if error:
+      inserter.error(line, error)
+      continue
+    data, errors = validate_row(form_class, row)
+    if errors:
+      inserter.error(line, errors)
+      continue
+    if model is Show:
+      try:
+        data['artist_id'] = int(data['artist_id'])
+        data['venue_id'] = int(data['venue_id'])
+      except (TypeError, ValueError):
+        inserter.error(line, {'artist_id': ['Artist and venue ids must be integers.']})
+        continue
+      show_ids['venue_id'].add(data['venue_id'])
+      show_ids['artist_id'].add(data['artist_id'])
+    inserter.add(line, {c: data[c] for c in columns if c in data})
+  inserter.flush()
+  if model is not Show:
+    assign_locations(model)
+
+  # imported shows skip record_show(); their venues and artists are
+  # recomputed instead
+  for key, ids in show_ids.items():
+    refresh_show_summaries(getattr(Show, key), list(ids))
+  db.session.commit()
+
+  invalidate_listings(model)
+  return {'inserted': inserter.inserted, 'errors': inserter.errors}
+
+def import_format(filename, mimetype):
+  if (filename or '').endswith('.csv') or mimetype == 'text/csv':
+    return 'csv'
+  return 'ndjson'
+
+@app.route('/import/<kind>', methods=['POST'])
+def bulk_import(kind):
+  # Streams a CSV or NDJSON upload, sent either as the "file" field of a
+  # multipart form or as the raw request body
+  if kind not in IMPORTS:
+    abort(404)
+  upload = request.files.get('file')
+  if upload:
+    stream, format = upload.stream, import_format(upload.filename, upload.mimetype)
+  else:
+    stream, format = request.stream, import_format(None, request.mimetype)
+  format = request.args.get('format', format)
+  if format not in ('csv', 'ndjson'):
+    abort(400)
+
+  report = import_rows(kind, io.TextIOWrapper(stream, encoding='utf-8', newline=''),
+    format, request.args.get('batch_size', type=int))
+  return jsonify({
+    'success': True,
+    'inserted': report['inserted'],
+    'errors': report['errors'],
+  })
+
+@app.cli.command('import-data')
+@click.argument('kind', type=click.Choice(sorted(IMPORTS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', type=click.Choice(['csv', 'ndjson']), help='Defaults to the file extension.')
+@click.option('--batch-size', type=int, help='Rows per INSERT, defaults to IMPORT_BATCH_SIZE.')
+def import_data_command(kind, path, format, batch_size):
+  """Bulk load venues, artists or shows from a CSV or NDJSON file."""
+  with open(path, encoding='utf-8', newline='') as stream:
+    report = import_rows(kind, stream, format or import_format(path, None), batch_size)
+  for error in report['errors']:
+    click.echo('line {}: {}'.format(error['line'], error['errors']), err=True)
+  click.echo('Imported {} {}, {} rows rejected.'.format(report['inserted'], kind, len(report['errors'])))
+
+@app.cli.command('roll-shows')
+@click.option('--rebuild', is_flag=True, help='Recompute every summary instead of the due ones.')
+def roll_shows_command(rebuild):
+  """Move shows that have started from upcoming to past in the show summaries.
+
+  Meant to run periodically (e.g. every minute from cron); until it runs,
+  listings count shows that have just started as upcoming.
+  """
+  if rebuild:
+    for key in SHOW_SUMMARIES:
+      refresh_show_summaries(getattr(Show, key))
+    db.session.commit()
+    click.echo('Rebuilt the show summaries.')
+  else:
+    click.echo('Rolled {} show summaries.'.format(roll_show_summaries()))
+
+#----------------------------------------------------------------------------#
+#  Query plans
+#----------------------------------------------------------------------------#
+
+def controller_queries():
+  # The queries the controllers run, built with sample arguments from the
+  # same helpers the controllers call so the plans cannot drift from them
+  venue_id = db.session.query(func.max(Venue.id)).scalar() or 0
+  artist_id = db.session.query(func.max(Artist.id)).scalar() or 0
+  artist_name = db.session.query(Artist.name).filter(Artist.id == artist_id).scalar() or ''
+  return [
+    ('index', recent_listings_query(Artist)),
+    ('index', recent_listings_query(Venue)),
+    ('venues', venue_areas_query()),
+    ('search_venues', search_by_name(Venue, 'music')),
+    ('search_venues', upcoming_show_counts_query(Show.venue_id, [venue_id])),
+    ('search_artists', search_by_name(Artist, 'music')),
+    ('search_artists', upcoming_show_counts_query(Show.artist_id, [artist_id])),
+    ('search_tags', search_by_genres(Artist, ['Jazz', 'Blues'], True, 1)),
+    ('search_tags', count_by_genres(Artist, ['Jazz', 'Blues'], True)),
+    ('search_tags', search_by_genres(Venue, ['Jazz', 'Blues'], False, 1)),
+    ('search_tags', count_by_genres(Venue, ['Jazz', 'Blues'], False)),
+    ('search_location', search_by_location(Artist, 'San Francisco, CA')),
+    ('search_location', search_by_location(Venue, 'San Francisco, CA')),
+    ('search_venues_near', venues_near(37.77, -122.42, 10)),
+    ('show_venue', Venue.query.filter(Venue.id == venue_id)),
+    ('show_venue', show_rows(Show.venue_id == venue_id)),
+    ('show_artist', Artist.query.filter(Artist.id == artist_id)),
+    ('show_artist', show_rows(Show.artist_id == artist_id)),
+    ('shows', show_rows(*show_filters({'when': 'upcoming'})).limit(app.config['SHOWS_PER_PAGE'] + 1)),
+    ('artists', artist_page_query(app.config['ARTISTS_PER_PAGE'])),
+    ('artists', artist_page_query(app.config['ARTISTS_PER_PAGE'], (artist_name, artist_id))),
+    ('artists', artist_letters_query()),
+  ]
+
+def explain_analyze(query):
+  # Runs the query under EXPLAIN ANALYZE and returns the plan and its
+  # execution time in milliseconds
+  compiled = query.statement.compile(dialect=db.engine.dialect)
+  explained = db.session.connection().execute(
+    'EXPLAIN (ANALYZE, FORMAT JSON) ' + str(compiled), compiled.params).scalar()
+  if isinstance(explained, str):
+    explained = json.loads(explained)
+  return explained[0]['Plan'], explained[0]['Execution Time']
+
+def seq_scans(plan):
+  scans = []
+  if plan['Node Type'] == 'Seq Scan':
+    scans.append(plan['Relation Name'])
+  for child in plan.get('Plans', []):
+    scans.extend(seq_scans(child))
+  return scans
+
+@app.cli.command('explain-queries')
+@click.option('--strict', is_flag=True, help='Exit with an error if any query uses a sequential scan.')
+def explain_queries_command(strict):
+  """EXPLAIN ANALYZE every controller query and flag sequential scans."""
+  if db.engine.dialect.name != 'postgresql':
+    raise click.ClickException('Query plans can only be inspected on PostgreSQL.')
+  flagged = 0
+  try:
+    for controller, query in controller_queries():
+      plan, execution_time = explain_analyze(query)
+      scans = seq_scans(plan)
+      flagged += bool(scans)
+      click.echo('{:<16} {:>10.3f} ms  {}'.format(controller, execution_time,
+        'SEQ SCAN on ' + ', '.join(sorted(set(scans))) if scans else 'ok'))
   finally:
-    db.session.close()
-    return redirect(url_for('index'))
+    db.session.rollback()
+  if flagged:
+    click.echo('{} queries use sequential scans. Small tables are often scanned '
+      'by choice; check against production-sized data.'.format(flagged))
+    if strict:
+      raise click.ClickException('sequential scans found')
+
+#----------------------------------------------------------------------------#
+#  Write jobs
+#----------------------------------------------------------------------------#
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+  job = write_queue.status(job_id)
+  if job is None:
+    abort(404)
+  return jsonify(job)
+
+@app.route('/jobs/drain', methods=['POST'])
+def drain_jobs():
+  # Waits for the queued writes of this worker to finish; for tests and
+  # benchmarks only
+  if not (app.config['TESTING'] or app.debug):
+    abort(404)
+  return jsonify({'drained': write_queue.drain(), 'pending': write_queue.pending()})
+
+#----------------------------------------------------------------------------#
+#  Metrics
+#----------------------------------------------------------------------------#
+
+@app.route('/metrics')
+def metrics():
+  # Connection pool usage of this worker process: connections checked out
+  # and opened beyond pool_size, and the time spent waiting for them
+  return jsonify({'pool': db.engine.pool.stats()})
 
 @app.errorhandler(404)
 def not_found_error(error):
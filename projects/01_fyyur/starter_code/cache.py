@@ -0,0 +1,149 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+from threading import Lock
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class SimpleCache(object):
+    '''
+    SimpleCache
+        an in-process key/value store where every entry expires after
+        its own time to live (in seconds)
+    '''
+
+    def __init__(self, default_timeout=300):
+        self.default_timeout = default_timeout
+        self._entries = {}
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        with self._lock:
+            self._entries[key] = (time.time() + timeout, value)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileSystemCache(object):
+    '''
+    FileSystemCache
+        keeps each entry in a pickle file under a shared directory, so every
+        worker process on the host sees the same cache without running a
+        cache server
+    '''
+
+    def __init__(self, directory, default_timeout=300):
+        self.directory = directory
+        self.default_timeout = default_timeout
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.md5(key.encode()).hexdigest())
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        # written aside and renamed so readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((time.time() + timeout, value), f)
+        os.replace(tmp, self._path(key))
+
+    def delete(self, *keys):
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+
+class RedisCache(object):
+    '''
+    RedisCache
+        shares the cache between hosts through a Redis server; needs the
+        optional redis package
+    '''
+
+    def __init__(self, url, default_timeout=300, prefix='fyyur:'):
+        if redis is None:
+            raise RuntimeError('CACHE_TYPE "redis" requires the redis package')
+        self.default_timeout = default_timeout
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._client.get(self.prefix + key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        self._client.set(self.prefix + key, pickle.dumps(value), ex=max(int(timeout), 1))
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + '*'):
+            self._client.delete(key)
+
+
+def make_cache(config):
+    '''
+    make_cache(config)
+        builds the backend named by CACHE_TYPE: "simple" (per process, the
+        default), "filesystem" (CACHE_DIR) or "redis" (CACHE_REDIS_URL)
+    '''
+    cache_type = config.get('CACHE_TYPE', 'simple')
+    timeout = config.get('CACHE_DEFAULT_TIMEOUT', 300)
+    if cache_type == 'filesystem':
+        return FileSystemCache(config['CACHE_DIR'], timeout)
+    if cache_type == 'redis':
+        return RedisCache(config['CACHE_REDIS_URL'], timeout)
+    return SimpleCache(timeout)
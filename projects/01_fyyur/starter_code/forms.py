@@ -1,8 +1,8 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import BooleanField, StringField, SelectField, SelectMultipleField, DateTimeField
+from wtforms import BooleanField, StringField, SelectField, SelectMultipleField, DateTimeField, FloatField
 from wtforms.fields.html5 import  URLField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms.validators import DataRequired, AnyOf, URL, Optional, NumberRange
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -86,6 +86,12 @@ class VenueForm(Form):
     phone = StringField(
         'phone'
     )
+    latitude = FloatField(
+        'latitude', validators=[Optional(), NumberRange(-90, 90)]
+    )
+    longitude = FloatField(
+        'longitude', validators=[Optional(), NumberRange(-180, 180)]
+    )
     seeking_talent = BooleanField(
         'seeking_talent', validators=[]
     )
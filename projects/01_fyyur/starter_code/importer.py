@@ -0,0 +1,156 @@
+import csv
+import json
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.datastructures import MultiDict
+from wtforms import BooleanField
+from wtforms.validators import DataRequired
+
+# Fields that hold several values; CSV cells list them comma separated
+LIST_FIELDS = ('genres',)
+
+# Spellings accepted for the checkbox fields, compared lower-cased
+TRUE_VALUES = ('true', '1', 'yes', 'y', 'on')
+FALSE_VALUES = ('false', '0', 'no', 'n', 'off', '')
+
+
+def read_rows(stream, format):
+    '''
+    read_rows(stream, format)
+        lazily yields (line, row, error) from a text stream of CSV (with a
+        header line) or NDJSON, so large files are never held in memory;
+        row is None when the line could not be parsed
+    '''
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+    else:
+        for line, text in enumerate(stream, 1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError as e:
+                yield line, None, str(e)
+                continue
+            if not isinstance(row, dict):
+                yield line, None, 'Expected a JSON object'
+                continue
+            yield line, row, None
+
+
+def boolean_fields(form_class):
+    return {name for name in dir(form_class)
+            if getattr(getattr(form_class, name), 'field_class', None) is BooleanField}
+
+
+def required_fields(form_class):
+    return {name for name in dir(form_class)
+            if any(isinstance(validator, DataRequired) for validator in
+                   getattr(getattr(form_class, name), 'kwargs', {}).get('validators', ()))}
+
+
+def to_boolean(value):
+    # True, False, or None for a value that is neither
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    return None
+
+
+def to_formdata(row, booleans=()):
+    formdata = MultiDict()
+    for key, value in row.items():
+        if value is None:
+            continue
+        if key in booleans:
+            # a checkbox is checked by any submitted value but "false", so
+            # only true values are sent, as a browser would
+            if to_boolean(value):
+                formdata.add(key, 'y')
+            continue
+        if isinstance(value, list):
+            values = value
+        elif key in LIST_FIELDS and isinstance(value, str):
+            values = [v.strip() for v in value.split(',') if v.strip()]
+        else:
+            values = [value]
+        for v in values:
+            formdata.add(key, v if isinstance(v, str) else json.dumps(v))
+    return formdata
+
+
+def validate_row(form_class, row):
+    '''
+    validate_row(form_class, row)
+        runs the row through the same WTForm used by the create pages and
+        returns (data, errors)
+    '''
+    booleans = boolean_fields(form_class)
+    errors = {key: ['Expected true or false.'] for key in booleans
+              if row.get(key) is not None and to_boolean(row[key]) is None}
+    if errors:
+        return None, errors
+    # checked apart from the form, whose field defaults (such as ShowForm's
+    # start_time, fixed when forms.py is imported) would fill them in
+    missing = {key: ['This field is required.'] for key in required_fields(form_class)
+               if row.get(key) is None or str(row[key]).strip() == ''}
+    form = form_class(formdata=to_formdata(row, booleans), meta={'csrf': False})
+    if not form.validate() or missing:
+        return None, dict(form.errors, **missing)
+    return form.data, None
+
+
+class BatchInserter(object):
+    '''
+    BatchInserter
+        collects validated rows and writes them with one executemany INSERT
+        (and commit) per batch. A batch that the database rejects is retried
+        row by row so only the offending rows are reported.
+        check_batch(values) may return {index: error} for rows to skip.
+    '''
+
+    def __init__(self, session, table, batch_size, check_batch=None):
+        self.session = session
+        self.table = table
+        self.batch_size = batch_size
+        self.check_batch = check_batch
+        self.pending = []
+        self.inserted = 0
+        self.errors = []
+
+    def add(self, line, values):
+        self.pending.append((line, values))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def error(self, line, errors):
+        self.errors.append({'line': line, 'errors': errors})
+
+    def flush(self):
+        batch, self.pending = self.pending, []
+        if self.check_batch and batch:
+            rejected = self.check_batch([values for line, values in batch])
+            for index in sorted(rejected):
+                self.error(batch[index][0], rejected[index])
+            batch = [row for index, row in enumerate(batch) if index not in rejected]
+        if not batch:
+            return
+        try:
+            self.session.execute(self.table.insert(), [values for line, values in batch])
+            self.session.commit()
+            self.inserted += len(batch)
+        except SQLAlchemyError:
+            self.session.rollback()
+            for line, values in batch:
+                try:
+                    self.session.execute(self.table.insert(), values)
+                    self.session.commit()
+                    self.inserted += 1
+                except SQLAlchemyError as e:
+                    self.session.rollback()
+                    self.error(line, str(getattr(e, 'orig', e)))
@@ -0,0 +1,79 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
+
+
+class WriteQueue(object):
+    '''
+    WriteQueue
+        runs write jobs on a pool of background threads, each inside its
+        own app context and database session. A job is a function returning
+        (succeeded, message); its state and message are kept in the cache
+        under "job:<id>" so any worker sharing the cache can report them.
+        Jobs live in memory only: those still queued when the process
+        stops are lost.
+    '''
+
+    def __init__(self, app, db, cache, workers=4, result_timeout=3600):
+        self.app = app
+        self.db = db
+        self.cache = cache
+        self.workers = workers
+        self.result_timeout = result_timeout
+        self._executor = None
+        self._futures = set()
+        self._lock = Lock()
+
+    def submit(self, func, *args):
+        job_id = uuid.uuid4().hex
+        self._save(job_id, 'queued')
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='write-queue')
+            future = self._executor.submit(self._run, job_id, func, args)
+            self._futures.add(future)
+        future.add_done_callback(self._done)
+        return job_id
+
+    def status(self, job_id):
+        '''
+        status(job_id)
+            {"id", "status", "message"} where status is "queued", "running",
+            "succeeded" or "failed"; None for an unknown or expired job
+        '''
+        return self.cache.get('job:' + job_id)
+
+    def pending(self):
+        with self._lock:
+            return len(self._futures)
+
+    def drain(self, timeout=None):
+        '''
+        drain(timeout=None)
+            waits until every job submitted so far has finished and returns
+            how many were waited for
+        '''
+        with self._lock:
+            futures = list(self._futures)
+        wait(futures, timeout)
+        return len(futures)
+
+    def _run(self, job_id, func, args):
+        self._save(job_id, 'running')
+        with self.app.app_context():
+            try:
+                succeeded, message = func(*args)
+            except Exception:
+                self.app.logger.exception('write job %s failed', job_id)
+                succeeded, message = False, 'An error occurred. Your changes could not be saved.'
+            finally:
+                self.db.session.remove()
+        self._save(job_id, 'succeeded' if succeeded else 'failed', message)
+
+    def _done(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def _save(self, job_id, status, message=None):
+        self.cache.set('job:' + job_id, {'id': job_id, 'status': status, 'message': message},
+                       self.result_timeout)
@@ -0,0 +1,66 @@
+"""data version log
+
+Revision ID: 2e419a2a11e2
+Revises: 169968ebe656
+Create Date: 2026-10-18 04:32:11.698630
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2e419a2a11e2'
+down_revision = '169968ebe656'
+branch_labels = None
+depends_on = None
+
+
+
+# Replaces the one counter row per table, which every writer of the table
+# had to lock until commit, with an append-only log of writes
+BUMP_DATA_VERSION = '''
+    CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+    DECLARE
+      entry bigint;
+    BEGIN
+      INSERT INTO "DataVersion" (table_name) VALUES (TG_TABLE_NAME) RETURNING id INTO entry;
+      IF mod(entry, 1000) = 0 THEN
+        DELETE FROM "DataVersion" WHERE table_name = TG_TABLE_NAME AND id < entry - 1000;
+      END IF;
+      RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+'''
+
+BUMP_DATA_VERSION_COUNTER = '''
+    CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+    BEGIN
+      INSERT INTO "DataVersion" (table_name, version) VALUES (TG_TABLE_NAME, 1)
+      ON CONFLICT (table_name) DO UPDATE SET version = "DataVersion".version + 1;
+      RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+'''
+
+
+def upgrade():
+    op.drop_table('DataVersion')
+    op.create_table('DataVersion',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('table_name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_DataVersion_table_name_id', 'DataVersion', ['table_name', 'id'], unique=False)
+    op.execute(BUMP_DATA_VERSION)
+
+
+def downgrade():
+    op.drop_index('ix_DataVersion_table_name_id', table_name='DataVersion')
+    op.drop_table('DataVersion')
+    op.create_table('DataVersion',
+    sa.Column('table_name', sa.String(length=120), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    op.execute(BUMP_DATA_VERSION_COUNTER)
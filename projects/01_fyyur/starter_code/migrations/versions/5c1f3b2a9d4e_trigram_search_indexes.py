@@ -0,0 +1,44 @@
+"""trigram search indexes
+
+Revision ID: 5c1f3b2a9d4e
+Revises: 120a8d874c78
+Create Date: 2026-10-18 03:40:12.514203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1f3b2a9d4e'
+down_revision = '120a8d874c78'
+branch_labels = None
+depends_on = None
+
+# GIN trigram indexes let Postgres answer ILIKE '%term%' without a
+# sequential scan. They live only in migrations (see include_object in
+# env.py) because create_all() cannot assume pg_trgm is installed.
+TRIGRAM_INDEXES = [
+    ('ix_Venue_name_trgm', 'Venue', 'name'),
+    ('ix_Venue_city_trgm', 'Venue', 'city'),
+    ('ix_Artist_name_trgm', 'Artist', 'name'),
+    ('ix_Artist_city_trgm', 'Artist', 'city'),
+]
+
+
+def upgrade():
+    available = op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).scalar()
+    if not available:
+        # searches still work, as unindexed ILIKE scans ranked in plain SQL
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRIGRAM_INDEXES:
+        op.create_index(name, table, [column], unique=False,
+                        postgresql_using='gin',
+                        postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade():
+    for name, table, column in TRIGRAM_INDEXES:
+        op.execute('DROP INDEX IF EXISTS "%s"' % name)
@@ -0,0 +1,41 @@
+"""drop city trigram indexes
+
+Revision ID: c4196b608ee3
+Revises: 2e419a2a11e2
+Create Date: 2026-10-18 04:34:35.782093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4196b608ee3'
+down_revision = '2e419a2a11e2'
+branch_labels = None
+depends_on = None
+
+
+# Searches match names only, and the area listings and filters go through
+# "Location" since 9e0e7c63ad42, so nothing runs ILIKE on city any more and
+# these indexes only slowed down writes.
+CITY_TRIGRAM_INDEXES = [
+    ('ix_Venue_city_trgm', 'Venue'),
+    ('ix_Artist_city_trgm', 'Artist'),
+]
+
+
+def upgrade():
+    for name, table in CITY_TRIGRAM_INDEXES:
+        op.execute('DROP INDEX IF EXISTS "%s"' % name)
+
+
+def downgrade():
+    installed = op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar()
+    if not installed:
+        return
+    for name, table in CITY_TRIGRAM_INDEXES:
+        op.create_index(name, table, ['city'], unique=False,
+                        postgresql_using='gin',
+                        postgresql_ops={'city': 'gin_trgm_ops'})
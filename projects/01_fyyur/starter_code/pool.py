@@ -0,0 +1,57 @@
+import time
+from threading import Lock
+
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+class TimedQueuePool(QueuePool):
+    '''
+    TimedQueuePool
+        a QueuePool that also records how long checkouts take: the time
+        spent waiting for a free connection, or opening a new one
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_time += elapsed
+                self.max_wait = max(self.max_wait, elapsed)
+
+    def stats(self):
+        '''
+        stats()
+            current pool usage along with the checkout timings so far
+        '''
+        with self._stats_lock:
+            checkouts, timeouts = self.checkouts, self.timeouts
+            wait_time, max_wait = self.wait_time, self.max_wait
+        return {
+            'size': self.size(),
+            'checked_out': self.checkedout(),
+            'checked_in': self.checkedin(),
+            'overflow': max(self.overflow(), 0),
+            'max_overflow': self._max_overflow,
+            'checkouts': checkouts,
+            'timeouts': timeouts,
+            'wait_ms_total': round(wait_time * 1000, 3),
+            'wait_ms_avg': round(wait_time * 1000 / checkouts, 3) if checkouts else 0.0,
+            'wait_ms_max': round(max_wait * 1000, 3),
+        }
@@ -0,0 +1,751 @@
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+import unittest
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import template_rendered
+from sqlalchemy import event
+
+from app import app, db, cache, write_queue, format_datetime, refresh_show_summaries, assign_locations, \
+    Venue, Artist, Show, VenueShowSummary, ArtistShowSummary, Location
+from cache import FileSystemCache
+
+
+@contextmanager
+def recorded_statements():
+    # the SQL statements run while the block executes
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@contextmanager
+def rendered_contexts():
+    # the context of each template rendered while the block executes
+    contexts = []
+
+    def record(sender, template, context, **extra):
+        contexts.append(context)
+
+    template_rendered.connect(record, app)
+    try:
+        yield contexts
+    finally:
+        template_rendered.disconnect(record, app)
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.database_name = "fyyur_test"
+        self.database_path = "postgresql://{}/{}".format(
+            'postgres:1234@localhost:5432', self.database_name)
+        app.config['SQLALCHEMY_DATABASE_URI'] = self.database_path
+        app.config['SQLALCHEMY_ECHO'] = False
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        app.config['SHOWS_PER_PAGE'] = 30
+        app.config['ARTISTS_PER_PAGE'] = 50
+        app.config['VENUES_CACHE_TTL'] = 60
+        app.config['SEARCH_RESULTS_LIMIT'] = 50
+        app.config['STREAM_LISTINGS'] = False
+        app.config['STREAM_BATCH_SIZE'] = 500
+        app.config['WRITE_QUEUE'] = ''
+        self.client = app.test_client
+        cache.clear()
+
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+
+        self.venue = Venue(name='The Musical Hop', city='San Francisco', state='CA', genres=['Jazz'])
+        self.artist = Artist(name='Guns N Petals', city='San Francisco', state='CA', genres=['Rock n Roll'])
+        db.session.add_all([self.venue, self.artist])
+        db.session.commit()
+        self.venue_id = self.venue.id
+        self.artist_id = self.artist.id
+
+    def tearDown(self):
+        """Executed after reach test"""
+        write_queue.drain()
+        db.session.remove()
+        db.drop_all()
+
+    def add_shows(self, count):
+        now = datetime.utcnow()
+        db.session.add_all([Show(
+            venue_id=self.venue_id,
+            artist_id=self.artist_id,
+            start_time=now + timedelta(days=i + 1) if i % 2 else now - timedelta(days=i + 1))
+            for i in range(count)])
+        # inserted directly, so the show summaries are recomputed as for an import
+        refresh_show_summaries(Show.venue_id)
+        refresh_show_summaries(Show.artist_id)
+        db.session.commit()
+        db.session.remove()
+
+    def count_queries(self, url):
+        with recorded_statements() as statements:
+            res = self.client().get(url)
+        self.assertEqual(res.status_code, 200)
+        return len(statements)
+
+    def test_show_venue(self):
+        self.add_shows(4)
+        res = self.client().get('/venues/{}'.format(self.venue_id))
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'2 Upcoming Shows', res.data)
+        self.assertIn(b'2 Past Shows', res.data)
+        self.assertIn(b'Guns N Petals', res.data)
+
+    def test_show_without_start_time(self):
+        self.add_shows(2)
+        db.session.add(Show(venue_id=self.venue_id, artist_id=self.artist_id, start_time=None))
+        db.session.commit()
+        for url in ('/venues/{}'.format(self.venue_id), '/artists/{}'.format(self.artist_id),
+                    '/venues/{}?format=json'.format(self.venue_id), '/shows'):
+            res = self.client().get(url)
+            self.assertEqual(res.status_code, 200, url)
+        self.assertIn(b'1 Upcoming Show<', self.client().get('/venues/{}'.format(self.venue_id)).data)
+
+    def test_show_artist(self):
+        self.add_shows(4)
+        res = self.client().get('/artists/{}'.format(self.artist_id))
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'The Musical Hop', res.data)
+
+    def test_show_venue_query_count_is_constant(self):
+        self.add_shows(1)
+        few = self.count_queries('/venues/{}'.format(self.venue_id))
+        self.add_shows(50)
+        many = self.count_queries('/venues/{}'.format(self.venue_id))
+        self.assertEqual(few, many)
+
+    def test_show_artist_query_count_is_constant(self):
+        self.add_shows(1)
+        few = self.count_queries('/artists/{}'.format(self.artist_id))
+        self.add_shows(50)
+        many = self.count_queries('/artists/{}'.format(self.artist_id))
+        self.assertEqual(few, many)
+
+    def test_shows_paginated(self):
+        app.config['SHOWS_PER_PAGE'] = 3
+        self.add_shows(7)
+        url = '/shows'
+        seen = 0
+        pages = 0
+        while url:
+            res = self.client().get(url)
+            self.assertEqual(res.status_code, 200)
+            seen += res.data.count(b'tile-show')
+            match = re.search(rb'href="([^"]*after=[^"]*)"', res.data)
+            url = match.group(1).decode().replace('&amp;', '&') if match else None
+            pages += 1
+        self.assertEqual(seen, 7)
+        self.assertEqual(pages, 3)
+
+    def test_shows_query_count_is_constant(self):
+        self.add_shows(1)
+        few = self.count_queries('/shows')
+        self.add_shows(50)
+        many = self.count_queries('/shows')
+        self.assertEqual(few, many)
+
+    def test_shows_filtered(self):
+        self.add_shows(6)
+        res = self.client().get('/shows?when=upcoming')
+        self.assertEqual(res.data.count(b'tile-show'), 3)
+        res = self.client().get('/shows?when=past')
+        self.assertEqual(res.data.count(b'tile-show'), 3)
+
+    def test_shows_bad_cursor(self):
+        res = self.client().get('/shows?after=not-a-cursor')
+        self.assertEqual(res.status_code, 400)
+
+    def test_venues_grouped_by_area(self):
+        db.session.add_all([
+            Venue(name='Park Square Live Music & Coffee', city='San Francisco', state='CA'),
+            Venue(name='The Dueling Pianos Bar', city='New York', state='NY')])
+        db.session.commit()
+        self.add_shows(4)
+        res = self.client().get('/venues')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data.count(b'<h3>'), 2)
+        self.assertIn(b'The Dueling Pianos Bar', res.data)
+
+    def test_venues_query_count(self):
+        self.add_shows(1)
+        app.config['VENUES_CACHE_TTL'] = 0
+        few = self.count_queries('/venues')
+        db.session.add_all([Venue(name='Venue %d' % i, city='City %d' % i, state='CA') for i in range(20)])
+        db.session.commit()
+        many = self.count_queries('/venues')
+        self.assertEqual(few, many)
+
+    def test_streamed_listings(self):
+        app.config['STREAM_LISTINGS'] = True
+        app.config['STREAM_BATCH_SIZE'] = 2
+        app.config['SHOWS_PER_PAGE'] = 3
+        db.session.add_all([
+            Venue(name='The Dueling Pianos Bar', city='New York', state='NY'),
+            Artist(name='Matt Quevedo', city='New York', state='NY')])
+        db.session.commit()
+        self.add_shows(4)
+
+        res = self.client().get('/venues')
+        self.assertTrue(res.is_streamed)
+        self.assertEqual(res.data.count(b'<h3>'), 2)
+        self.assertIn(b'The Dueling Pianos Bar', res.data)
+
+        res = self.client().get('/artists')
+        self.assertTrue(res.is_streamed)
+        self.assertIn(b'Guns N Petals', res.data)
+        self.assertIn(b'Matt Quevedo', res.data)
+
+        res = self.client().get('/shows')
+        self.assertTrue(res.is_streamed)
+        self.assertEqual(res.data.count(b'tile-show'), 3)
+        match = re.search(rb'href="([^"]*after=[^"]*)"', res.data)
+        res = self.client().get(match.group(1).decode().replace('&amp;', '&'))
+        self.assertEqual(res.data.count(b'tile-show'), 1)
+        self.assertNotIn(b'Next page', res.data)
+
+    def test_json_views(self):
+        self.add_shows(4)
+        res = self.client().get('/venues?format=json')
+        self.assertEqual(res.status_code, 200)
+        areas = res.get_json()['areas']
+        self.assertEqual(areas[0]['venues'][0]['num_upcoming_shows'], 2)
+
+        res = self.client().get('/artists', headers={'Accept': 'application/json'})
+        self.assertEqual(res.get_json()['artists'][0]['name'], 'Guns N Petals')
+
+        res = self.client().get('/shows?format=json')
+        shows = res.get_json()['shows']
+        self.assertEqual(len(shows), 4)
+        self.assertIsInstance(datetime.fromisoformat(shows[0]['start_time']), datetime)
+
+        res = self.client().get('/venues/{}?format=json'.format(self.venue_id))
+        self.assertEqual(res.get_json()['upcoming_shows_count'], 2)
+        res = self.client().get('/artists/{}?format=json'.format(self.artist_id))
+        self.assertEqual(res.get_json()['past_shows_count'], 2)
+        res = self.client().get('/artists/1000?format=json')
+        self.assertEqual(res.status_code, 404)
+
+        res = self.client().get('/artists')
+        self.assertIn(b'<h5>Guns N Petals</h5>', res.data)
+
+    def test_artist_pages(self):
+        app.config['ARTISTS_PER_PAGE'] = 2
+        names = ['Adele', 'Beck', 'Bjork', 'Moby']
+        db.session.add_all([Artist(name=name) for name in names])
+        db.session.commit()
+
+        res = self.client().get('/artists?format=json')
+        data = res.get_json()
+        self.assertEqual([a['name'] for a in data['artists']], ['Adele', 'Beck'])
+        self.assertEqual(data['letters'], [{'letter': 'A', 'count': 1}, {'letter': 'B', 'count': 2},
+                                           {'letter': 'G', 'count': 1}, {'letter': 'M', 'count': 1}])
+        res = self.client().get('/artists?format=json&after=' + data['next_cursor'])
+        self.assertEqual([a['name'] for a in res.get_json()['artists']], ['Bjork', 'Guns N Petals'])
+
+        res = self.client().get('/artists?page=3')
+        self.assertEqual(re.findall(rb'<h5>(.*)</h5>', res.data), [b'Moby'])
+        self.assertNotIn(b'Next page', res.data)
+        res = self.client().get('/artists?letter=G')
+        self.assertEqual(re.findall(rb'<h5>(.*)</h5>', res.data), [b'Guns N Petals', b'Moby'])
+        self.assertIn(b'letter=B', res.data)
+        self.assertEqual(self.client().get('/artists?after=bad').status_code, 400)
+
+    def test_artist_index_invalidated(self):
+        self.assertEqual(self.client().get('/artists?format=json').get_json()['letters'],
+                         [{'letter': 'G', 'count': 1}])
+        self.client().post('/artists/create', data={'name': 'Matt Quevedo', 'city': 'New York', 'state': 'NY'})
+        letters = self.client().get('/artists?format=json').get_json()['letters']
+        self.assertEqual([entry['letter'] for entry in letters], ['G', 'M'])
+
+    def test_artists_approximate_total(self):
+        db.session.execute('ANALYZE "Artist"')
+        db.session.commit()
+        res = self.client().get('/artists')
+        self.assertIn(b'About 1 artists', res.data)
+
+    def test_json_not_modified(self):
+        url = '/venues/{}?format=json'.format(self.venue_id)
+        res = self.client().get(url)
+        etag = res.headers['ETag']
+
+        with recorded_statements() as statements:
+            res = self.client().get(url, headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+        # only the data versions are read
+        self.assertEqual(len(statements), 1)
+        self.assertIn('"DataVersion"', statements[0])
+
+        self.client().post('/venues/{}/edit'.format(self.venue_id), data={
+            'name': 'The Musical Hop', 'city': 'Oakland', 'state': 'CA'})
+        res = self.client().get(url, headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertEqual(res.get_json()['city'], 'Oakland')
+
+    def test_json_etag_follows_other_writers(self):
+        # a write that goes around this process, as another worker's would
+        url = '/artists/{}?format=json'.format(self.artist_id)
+        etag = self.client().get(url).headers['ETag']
+        with db.engine.begin() as connection:
+            connection.execute('UPDATE "Artist" SET city = \'Oakland\' WHERE id = %s', self.artist_id)
+        res = self.client().get(url, headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json()['city'], 'Oakland')
+
+        # the cached listing snapshots follow the same versions
+        for url in ('/venues?format=json', '/artists?format=json'):
+            self.client().get(url)
+        with db.engine.begin() as connection:
+            connection.execute('UPDATE "Venue" SET name = \'Renamed Hall\' WHERE id = %s', self.venue_id)
+            connection.execute('UPDATE "Artist" SET name = \'Renamed Band\' WHERE id = %s', self.artist_id)
+        venues = self.client().get('/venues?format=json').get_json()['areas'][0]['venues']
+        self.assertEqual(venues[0]['name'], 'Renamed Hall')
+        letters = self.client().get('/artists?format=json').get_json()['letters']
+        self.assertEqual(letters, [{'letter': 'R', 'count': 1}])
+
+    def test_data_version_writers_do_not_wait(self):
+        other = Venue(name='Oakland Hall', city='Oakland', state='CA')
+        db.session.add(other)
+        db.session.commit()
+        first, second = db.engine.connect(), db.engine.connect()
+        try:
+            first_transaction, second_transaction = first.begin(), second.begin()
+            first.execute('UPDATE "Venue" SET city = \'Berkeley\' WHERE id = %s', self.venue_id)
+            second.execute("SET LOCAL lock_timeout = '1s'")
+            second.execute('UPDATE "Venue" SET city = \'Berkeley\' WHERE id = %s', other.id)
+            second_transaction.commit()
+            first_transaction.commit()
+        finally:
+            first.close()
+            second.close()
+
+    def test_pool_metrics(self):
+        self.client().get('/venues/{}'.format(self.venue_id))
+        res = self.client().get('/metrics')
+        self.assertEqual(res.status_code, 200)
+        pool = res.get_json()['pool']
+        self.assertEqual(pool['size'], app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'])
+        self.assertEqual(pool['checked_out'], 0)
+        self.assertEqual(pool['overflow'], 0)
+        self.assertGreater(pool['checkouts'], 0)
+        self.assertGreaterEqual(pool['wait_ms_max'], pool['wait_ms_avg'])
+
+    def summary(self, model, id):
+        row = db.session.query(model).get(id)
+        db.session.remove()
+        return row and (row.upcoming_shows_count, row.past_shows_count)
+
+    def test_show_summary_maintained(self):
+        other = Artist(name='Matt Quevedo', city='New York', state='NY')
+        db.session.add(other)
+        db.session.commit()
+        other_id = other.id
+        db.session.remove()
+
+        for artist_id, days in ((self.artist_id, 2), (self.artist_id, -2), (other_id, 5)):
+            res = self.client().post('/shows/create', data={
+                'venue_id': self.venue_id, 'artist_id': artist_id,
+                'start_time': (datetime.utcnow() + timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')})
+            self.assertEqual(res.status_code, 302)
+        self.assertEqual(self.summary(VenueShowSummary, self.venue_id), (2, 1))
+        self.assertEqual(self.summary(ArtistShowSummary, self.artist_id), (1, 1))
+        self.assertEqual(self.summary(ArtistShowSummary, other_id), (1, 0))
+        res = self.client().get('/venues?format=json')
+        self.assertEqual(res.get_json()['areas'][0]['venues'][0]['num_upcoming_shows'], 2)
+
+        self.client().post('/artists/{}/delete'.format(self.artist_id))
+        self.assertIsNone(self.summary(ArtistShowSummary, self.artist_id))
+        self.assertEqual(self.summary(VenueShowSummary, self.venue_id), (1, 0))
+
+        self.client().post('/venues/delete', json={'ids': [self.venue_id]})
+        self.assertIsNone(self.summary(VenueShowSummary, self.venue_id))
+        self.assertIsNone(self.summary(ArtistShowSummary, other_id))
+
+    def test_create_submissions_redirect(self):
+        for url in ('/venues/create', '/artists/create'):
+            res = self.client().post(url, data={'city': 'New York', 'state': 'NY'})
+            self.assertEqual(res.status_code, 302)
+
+        # stored as naive UTC, as the other start times
+        res = self.client().post('/shows/create', data={
+            'venue_id': self.venue_id, 'artist_id': self.artist_id,
+            'start_time': '2030-01-01T20:00:00+02:00'})
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual(Show.query.one().start_time, datetime(2030, 1, 1, 18, 0))
+        self.assertEqual(self.summary(VenueShowSummary, self.venue_id), (1, 0))
+
+    def test_roll_shows_command(self):
+        self.client().post('/shows/create', data={
+            'venue_id': self.venue_id, 'artist_id': self.artist_id,
+            'start_time': (datetime.utcnow() + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')})
+        # time passes: the show has started
+        started = datetime.utcnow() - timedelta(minutes=1)
+        Show.query.update({'start_time': started})
+        for model in (VenueShowSummary, ArtistShowSummary):
+            model.query.update({'next_show_time': started})
+        db.session.commit()
+        self.assertEqual(self.summary(VenueShowSummary, self.venue_id), (1, 0))
+
+        result = app.test_cli_runner().invoke(args=['roll-shows'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Rolled 2 show summaries.', result.output)
+        self.assertEqual(self.summary(VenueShowSummary, self.venue_id), (0, 1))
+        self.assertEqual(self.summary(ArtistShowSummary, self.artist_id), (0, 1))
+        row = db.session.query(VenueShowSummary).get(self.venue_id)
+        self.assertIsNone(row.next_show_time)
+        self.assertEqual(row.last_show_time, started)
+
+    def test_queued_writes(self):
+        app.config['WRITE_QUEUE'] = 'thread'
+        with self.client() as client:
+            res = client.post('/venues/create', data={
+                'name': 'The Dueling Pianos Bar', 'city': 'New York', 'state': 'NY'})
+            self.assertEqual(res.status_code, 302)
+            res = client.post('/shows/create', data={
+                'venue_id': 1000, 'artist_id': self.artist_id, 'start_time': '2030-01-01 20:00:00'})
+            self.assertEqual(res.status_code, 302)
+            with client.session_transaction() as session:
+                venue_job, show_job = session['pending_jobs']
+
+            write_queue.drain()
+            res = client.get('/jobs/{}'.format(venue_job))
+            self.assertEqual(res.get_json()['status'], 'succeeded')
+            res = client.get('/jobs/{}'.format(show_job))
+            self.assertEqual(res.get_json()['status'], 'failed')
+
+            # the outcomes are flashed once, on the next page
+            res = client.get('/')
+            self.assertIn(b'Venue The Dueling Pianos Bar was successfully listed!', res.data)
+            self.assertIn(b'Could not list show.', res.data)
+            res = client.get('/')
+            self.assertNotIn(b'successfully listed', res.data)
+            with client.session_transaction() as session:
+                self.assertEqual(session['pending_jobs'], [])
+
+        self.assertEqual(Venue.query.filter_by(name='The Dueling Pianos Bar').count(), 1)
+        self.assertEqual(self.client().get('/jobs/unknown').status_code, 404)
+
+    def test_queued_edit(self):
+        app.config['WRITE_QUEUE'] = 'thread'
+        self.client().post('/artists/{}/edit'.format(self.artist_id), data={'city': 'Oakland'})
+        res = self.client().post('/jobs/drain')
+        self.assertEqual(res.get_json()['pending'], 0)
+        self.assertEqual(Artist.query.get(self.artist_id).city, 'Oakland')
+
+    def test_venues_cached_until_venue_created(self):
+        self.client().get('/venues')
+        # only the data versions are read
+        self.assertEqual(self.count_queries('/venues'), 1)
+
+        res = self.client().post('/venues/create', data={
+            'name': 'The Dueling Pianos Bar', 'city': 'New York', 'state': 'NY'})
+        self.assertEqual(res.status_code, 302)
+        res = self.client().get('/venues')
+        self.assertIn(b'The Dueling Pianos Bar', res.data)
+
+    def count_search_queries(self, url, term):
+        with recorded_statements() as statements:
+            res = self.client().post(url, data={'search_term': term})
+        self.assertEqual(res.status_code, 200)
+        return len(statements)
+
+    def test_search_venues_upcoming_shows(self):
+        self.add_shows(4)
+        with rendered_contexts() as contexts:
+            res = self.client().post('/venues/search', data={'search_term': 'musical'})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'The Musical Hop', res.data)
+        # two of the four shows are in the future
+        self.assertEqual(contexts[0]['results'], {'count': 1, 'data': [
+            {'id': self.venue_id, 'name': 'The Musical Hop', 'num_upcoming_shows': 2}]})
+
+    def test_search_query_count_is_constant(self):
+        db.session.add(Artist(name='Petals', genres=['Jazz']))
+        db.session.commit()
+        self.add_shows(2)
+        searches = (('/venues/search', 'Hop'), ('/artists/search', 'Petals'), ('/tags/search', 'Jazz'))
+        # the first search also detects whether trigram search is available
+        self.client().post('/venues/search', data={'search_term': 'Hop'})
+        few = [self.count_search_queries(url, term) for url, term in searches]
+        db.session.add_all([Venue(name='Hop %d' % i, genres=['Jazz']) for i in range(20)] +
+                           [Artist(name='Petals %d' % i, genres=['Jazz']) for i in range(20)])
+        db.session.commit()
+        many = [self.count_search_queries(url, term) for url, term in searches]
+        self.assertEqual(few, many)
+
+    def test_search_ranked_and_limited(self):
+        app.config['SEARCH_RESULTS_LIMIT'] = 2
+        db.session.add_all([
+            Artist(name='The Wild Sax Band'),
+            Artist(name='Sax'),
+            Artist(name='Saxophone Trio')])
+        db.session.commit()
+        res = self.client().post('/artists/search', data={'search_term': 'sax'})
+        self.assertIn(b'search results for "sax": 3', res.data)
+        self.assertEqual(res.data.count(b'<h5>'), 2)
+        self.assertLess(res.data.index(b'>Sax<'), res.data.index(b'Saxophone Trio'))
+
+    def test_search_escapes_wildcards(self):
+        res = self.client().post('/venues/search', data={'search_term': '%'})
+        self.assertIn(b'search results for "%": 0', res.data)
+
+    def test_search_tags_all_and_any(self):
+        db.session.add_all([
+            Artist(name='Jazz Rock Trio', genres=['Jazz', 'Rock n Roll']),
+            Venue(name='Jazz Only Club', genres=['Jazz'])])
+        db.session.commit()
+        res = self.client().post('/tags/search', data={'genres': ['Jazz', 'Rock n Roll']})
+        self.assertIn(b'Jazz Rock Trio', res.data)
+        self.assertNotIn(b'The Musical Hop', res.data)
+        self.assertNotIn(b'Guns N Petals', res.data)
+
+        res = self.client().post('/tags/search', data={'genres': ['Jazz', 'Rock n Roll'], 'match': 'any'})
+        self.assertIn(b'": 4</h3>', res.data)
+
+    def test_search_tags_paginated(self):
+        app.config['SEARCH_RESULTS_LIMIT'] = 2
+        db.session.add_all([Venue(name='Jazz Venue %d' % i, genres=['Jazz']) for i in range(4)] +
+                           [Artist(name='Jazz Artist', genres=['Jazz'])])
+        db.session.commit()
+        res = self.client().post('/tags/search', data={'search_term': 'Jazz'})
+        self.assertIn(b'": 6</h3>', res.data)
+        self.assertEqual(res.data.count(b'<h5>'), 3)
+        self.assertIn(b'Next page', res.data)
+        # past the last page of artists, which still count towards the total
+        res = self.client().post('/tags/search', data={'search_term': 'Jazz', 'page': 3})
+        self.assertIn(b'": 6</h3>', res.data)
+        self.assertEqual(res.data.count(b'<h5>'), 1)
+        self.assertNotIn(b'Next page', res.data)
+
+    def test_search_location(self):
+        # created directly, so their locations are assigned as after an import
+        assign_locations(Venue)
+        assign_locations(Artist)
+        db.session.commit()
+        self.client().post('/artists/create', data={'name': 'Matt Quevedo', 'city': ' new york ', 'state': 'NY'})
+        self.assertEqual(Location.query.count(), 2)
+
+        for term in ('San Francisco, CA', 'san francisco', 'CA', 'Fran, C'):
+            res = self.client().post('/search', data={'search_term': term})
+            self.assertEqual(res.status_code, 200)
+            self.assertIn(b'The Musical Hop', res.data)
+            self.assertIn(b'Guns N Petals', res.data)
+            self.assertNotIn(b'Matt Quevedo', res.data)
+        res = self.client().post('/search', data={'search_term': 'New York, NY'})
+        self.assertIn(b'"New York, NY": 1</h3>', res.data)
+        res = self.client().post('/search', data={'search_term': 'San Francisco, NY'})
+        self.assertIn(b'": 0</h3>', res.data)
+
+        self.client().post('/artists/{}/edit'.format(self.artist_id), data={'city': 'New York', 'state': 'NY'})
+        res = self.client().post('/search', data={'search_term': 'New York'})
+        self.assertIn(b'Guns N Petals', res.data)
+
+    def test_venues_near(self):
+        self.client().post('/venues/{}/edit'.format(self.venue_id),
+                           data={'latitude': '37.7749', 'longitude': '-122.4194'})
+        db.session.add_all([
+            Venue(name='Oakland Hall', latitude=37.8044, longitude=-122.2712),
+            Venue(name='Los Angeles Club', latitude=34.0522, longitude=-118.2437),
+            Venue(name='Fiji Stage', latitude=-17.8, longitude=179.9),
+            Venue(name='No Coordinates')])
+        db.session.commit()
+
+        res = self.client().get('/venues/near?lat=37.7749&lon=-122.4194&miles=10&format=json')
+        venues = res.get_json()['venues']
+        self.assertEqual([v['name'] for v in venues], ['The Musical Hop', 'Oakland Hall'])
+        self.assertEqual(venues[0]['distance'], 0)
+        self.assertAlmostEqual(venues[1]['distance'], 8.4, 0)
+        res = self.client().get('/venues/near?lat=37.7749&lon=-122.4194&miles=400&format=json')
+        self.assertEqual(res.get_json()['count'], 3)
+        res = self.client().get('/venues/near?lat=-17.8&lon=-179.9&miles=20')
+        self.assertIn(b'Fiji Stage', res.data)
+
+        for query in ('lat=91&lon=0', 'lat=x&lon=0', 'lon=0', 'lat=0&lon=0&miles=0', 'lat=0&lon=0&miles=10000'):
+            self.assertEqual(self.client().get('/venues/near?' + query).status_code, 400)
+
+    def venue_row(self, **values):
+        row = {
+            'name': 'The Dueling Pianos Bar', 'city': 'New York', 'state': 'NY',
+            'address': '335 Delancey Street', 'phone': '914-003-1132',
+            'genres': ['Classical', 'R&B'], 'seeking_talent': False,
+            'facebook_link': 'https://www.facebook.com/theduelingpianos',
+            'image_link': 'https://images.unsplash.com/photo-1497032205916',
+            'website': 'https://www.theduelingpianos.com'}
+        row.update(values)
+        return row
+
+    def test_bulk_import_ndjson(self):
+        lines = [json.dumps(self.venue_row(name='Venue %d' % i)) for i in range(5)]
+        lines.insert(2, json.dumps(self.venue_row(state='XX')))
+        lines.insert(4, '{not json')
+        res = self.client().post('/import/venues?batch_size=2', data='\n'.join(lines),
+                                 content_type='application/x-ndjson')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['inserted'], 5)
+        self.assertEqual([e['line'] for e in data['errors']], [3, 5])
+        self.assertIn('state', data['errors'][0]['errors'])
+        self.assertEqual(Venue.query.filter(Venue.name.like('Venue %')).count(), 5)
+        self.assertEqual(Venue.query.filter_by(name='Venue 0').one().genres, ['Classical', 'R&B'])
+
+    def test_bulk_import_csv_booleans(self):
+        values = ['False', '0', 'no', 'TRUE', '1', 'Yes', '', 'maybe']
+        upload = io.StringIO()
+        writer = csv.DictWriter(upload, fieldnames=list(self.venue_row()))
+        writer.writeheader()
+        for i, value in enumerate(values):
+            writer.writerow(self.venue_row(name='Venue %d' % i, genres='Jazz', seeking_talent=value))
+        res = self.client().post('/import/venues', data=upload.getvalue(), content_type='text/csv')
+        data = json.loads(res.data)
+        self.assertEqual(data['inserted'], 7)
+        self.assertEqual(data['errors'], [{'line': 9, 'errors': {'seeking_talent': ['Expected true or false.']}}])
+        seeking = dict(db.session.query(Venue.name, Venue.seeking_talent).filter(Venue.name.like('Venue %')))
+        self.assertEqual([seeking['Venue %d' % i] for i in range(7)],
+                         [False, False, False, True, True, True, False])
+
+    def test_bulk_import_csv_shows(self):
+        upload = 'artist_id,venue_id,start_time\n{0},{1},2035-05-21 21:30:00\n{0},9999,2035-05-21 21:30:00\n'.format(
+            self.artist_id, self.venue_id)
+        res = self.client().post('/import/shows', data={'file': (io.BytesIO(upload.encode()), 'shows.csv')})
+        data = json.loads(res.data)
+        self.assertEqual(data['inserted'], 1)
+        self.assertEqual(data['errors'], [{'line': 3, 'errors': {'venue_id': ['Venue does not exist.']}}])
+        self.assertEqual(Show.query.count(), 1)
+
+    def test_bulk_import_show_without_start_time(self):
+        lines = [json.dumps({'artist_id': self.artist_id, 'venue_id': self.venue_id}),
+                 json.dumps({'artist_id': self.artist_id, 'venue_id': self.venue_id, 'start_time': ' '})]
+        res = self.client().post('/import/shows', data='\n'.join(lines), content_type='application/x-ndjson')
+        data = json.loads(res.data)
+        self.assertEqual(data['inserted'], 0)
+        self.assertEqual(data['errors'], [
+            {'line': 1, 'errors': {'start_time': ['This field is required.']}},
+            {'line': 2, 'errors': {'start_time': ['This field is required.']}}])
+        self.assertEqual(Show.query.count(), 0)
+
+    def test_import_data_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as f:
+            f.write(json.dumps(self.venue_row()) + '\n')
+        try:
+            result = app.test_cli_runner().invoke(args=['import-data', 'venues', f.name])
+        finally:
+            os.remove(f.name)
+        self.assertIn('Imported 1 venues, 0 rows rejected.', result.output)
+        self.assertEqual(Venue.query.filter_by(name='The Dueling Pianos Bar').count(), 1)
+
+    def test_delete_venue_removes_shows(self):
+        self.add_shows(3)
+        res = self.client().post('/venues/{}/delete'.format(self.venue_id))
+        self.assertEqual(res.status_code, 302)
+        self.assertIsNone(Venue.query.get(self.venue_id))
+        self.assertEqual(Show.query.count(), 0)
+        self.assertIsNotNone(Artist.query.get(self.artist_id))
+
+    def test_delete_artist_query_count_is_constant(self):
+        other = Artist(name='Matt Quevedo')
+        db.session.add(other)
+        db.session.commit()
+        other_id = other.id
+        self.add_shows(1)
+        db.session.add_all([Show(venue_id=self.venue_id, artist_id=other_id,
+                                 start_time=datetime.utcnow()) for i in range(30)])
+        db.session.commit()
+        db.session.remove()
+
+        with recorded_statements() as few:
+            self.client().post('/artists/{}/delete'.format(self.artist_id))
+        with recorded_statements() as many:
+            self.client().post('/artists/{}/delete'.format(other_id))
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(Show.query.count(), 0)
+
+    def test_batch_delete_venues(self):
+        other = Venue(name='The Dueling Pianos Bar')
+        db.session.add(other)
+        db.session.commit()
+        ids = [self.venue_id, other.id, 9999]
+        self.add_shows(4)
+        res = self.client().post('/venues/delete', json={'ids': ids})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted'], 2)
+        self.assertEqual(data['shows_deleted'], 4)
+        self.assertEqual(Venue.query.count(), 0)
+
+    def test_batch_delete_bad_ids(self):
+        for ids in (['one'], ['1.5'], ['-1']):
+            res = self.client().post('/artists/delete', data={'ids': ids})
+            self.assertEqual(res.status_code, 400)
+        for body in ([self.artist_id], 'ids', {'ids': self.artist_id}, {'ids': str(self.artist_id)},
+                     {'ids': [True]}, {'ids': [float(self.artist_id)]}, {'ids': [str(self.artist_id)]}, {}):
+            res = self.client().post('/artists/delete', json=body)
+            self.assertEqual(res.status_code, 400)
+        self.assertIsNotNone(Artist.query.get(self.artist_id))
+
+    def test_explain_queries_command(self):
+        self.add_shows(2)
+        result = app.test_cli_runner().invoke(args=['explain-queries'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('show_venue', result.output)
+        self.assertIn(' ms ', result.output)
+        # the listing page, its cursor variant and the A-Z index
+        self.assertEqual(len(re.findall(r'^artists ', result.output, re.M)), 3)
+
+    def test_index_served_from_cache(self):
+        res = self.client().get('/')
+        self.assertIn(b'Guns N Petals', res.data)
+        self.assertEqual(self.count_queries('/'), 0)
+
+    def test_index_refreshed_on_create_and_delete(self):
+        self.client().get('/')
+        self.client().post('/artists/create', data={'name': 'Matt Quevedo', 'city': 'New York', 'state': 'NY'})
+        self.assertEqual(self.count_queries('/'), 0)
+        self.assertIn(b'Matt Quevedo', self.client().get('/').data)
+
+        self.client().post('/venues/{}/delete'.format(self.venue_id))
+        self.assertEqual(self.count_queries('/'), 0)
+        self.assertNotIn(b'The Musical Hop', self.client().get('/').data)
+
+    def test_filesystem_cache_is_shared(self):
+        directory = tempfile.mkdtemp()
+        first, second = FileSystemCache(directory), FileSystemCache(directory)
+        first.set('home', {'artists': []})
+        self.assertEqual(second.get('home'), {'artists': []})
+        second.delete('home')
+        self.assertIsNone(first.get('home'))
+        first.set('home', 1, timeout=-1)
+        self.assertIsNone(second.get('home'))
+        first.clear()
+        os.rmdir(directory)
+
+    def test_format_datetime(self):
+        start_time = datetime(2019, 5, 21, 21, 30)
+        self.assertEqual(format_datetime(start_time, 'full'), 'Tuesday May, 21, 2019 at 9:30PM')
+        self.assertEqual(format_datetime('2019-05-21T21:30:00.000Z', 'full'), 'Tuesday May, 21, 2019 at 9:30PM')
+        self.assertEqual(format_datetime(start_time), 'Tue 05, 21, 2019 9:30PM')
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
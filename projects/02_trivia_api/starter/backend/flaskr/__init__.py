@@ -1,20 +1,47 @@
 import os
-from flask import Flask, request, abort, jsonify
+import io
+import base64
+import json
+import click
+from flask import Flask, request, abort, jsonify, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from sqlalchemy.exc import SQLAlchemyError
 
-from random import randrange
+from models import setup_db, Question, Category, question_index, question_counts, \
+    cached_categories, search_questions, create_search_index
+from question_bank import import_questions, export_questions, bank_format, \
+    IMPORT_BATCH_SIZE, EXPORT_BATCH_SIZE
 
-from models import setup_db, Question, Category
+try:
+    from query_profiler import QueryProfiler
+except ImportError:
+    QueryProfiler = None
 
 QUESTIONS_PER_PAGE = 10
+MAX_QUESTIONS_PER_PAGE = 100
+
+
+def encode_cursor(question_id):
+    # Opaque token for the page after the given question
+    raw = json.dumps([question_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(token):
+    try:
+        question_id, = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return int(question_id)
+    except (ValueError, TypeError):
+        abort(400)
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
     setup_db(app)
+    if QueryProfiler is not None:
+        QueryProfiler(app)
     CORS(app, resources={r"/api/*": {"origins": "*"}})
 
     @app.after_request
@@ -31,26 +58,41 @@ def create_app(test_config=None):
             'http://localhost:3000')
         return response
 
-    def get_paginated_questions(page, category_id=None):
+    def get_paginated_questions(category_id=None):
+        # One page of questions ordered by id, and the token of the next
+        # page (None on the last one). ?after=<token> continues from an
+        # earlier page with an indexed id range instead of an OFFSET scan;
+        # ?page= offset paging is kept for the frontend. ?per_page= sets
+        # the page size, up to MAX_QUESTIONS_PER_PAGE.
+        per_page = request.args.get('per_page', QUESTIONS_PER_PAGE, type=int)
+        per_page = min(max(per_page, 1), MAX_QUESTIONS_PER_PAGE)
+        query = Question.query.order_by(Question.id)
         if category_id is not None:
-            paginated_questions = Question.query.filter(
-                Question.category == category_id +
-                1).paginate(
-                page,
-                QUESTIONS_PER_PAGE,
-                False)
+            query = query.filter(Question.category == category_id + 1)
+
+        after = request.args.get('after')
+        if after:
+            query = query.filter(Question.id > decode_cursor(after))
         else:
-            paginated_questions = Question.query.paginate(
-                page, QUESTIONS_PER_PAGE, False)
-        questions = [question.format()
-                     for question in paginated_questions.items]
-        return questions
+            page = max(request.args.get('page', 1, type=int), 1)
+            query = query.offset((page - 1) * per_page)
+
+        results = query.limit(per_page + 1).all()
+        next_page = None
+        if len(results) > per_page:
+            results = results[:per_page]
+            next_page = encode_cursor(results[-1].id)
+        questions = [question.format() for question in results]
+        return questions, next_page
+
+    def include_total():
+        # ?total=false leaves the count out of the listings
+        return request.args.get('total', 'true').lower() not in ('0', 'false', 'no')
 
     @app.route('/categories', methods=['GET'])
     def get_categories():
 
-        categories = Category.query.all()
-        categories = [{'id': c.id, 'type': c.type} for c in categories]
+        categories = cached_categories.get()
         if not categories:
             abort(404)
         return jsonify({
@@ -62,41 +104,37 @@ def create_app(test_config=None):
     @app.route('/list', methods=['GET'])
     def get_questions():
 
-        page = request.args.get('page', 1, type=int)
-        questions = get_paginated_questions(page)
+        questions, next_page = get_paginated_questions()
         if not questions:
             abort(404)
 
-        total_questions = len(Question.query.all())
-        available_categories = Category.query.all()
-        categories = []
-
-        for category in available_categories:
-            categories.append(category.type)
-
-        return jsonify({
+        categories = [category['type'] for category in cached_categories.get()]
+        response = {
             'success': True,
             'questions': questions,
-            'totalQuestions': total_questions,
             'categories': categories,
-        })
+            'next': next_page,
+        }
+        if include_total():
+            response['totalQuestions'] = question_counts.total()
+        return jsonify(response)
 
     @app.route('/categories/<int:category_id>/questions', methods=['GET'])
     def get_questions_by_category(category_id):
-        page = request.args.get('page', 1, type=int)
-        questions = get_paginated_questions(page, category_id)
+        questions, next_page = get_paginated_questions(category_id)
 
         if not questions:
             abort(404)
 
-        total_questions = len(questions)
-
-        return jsonify({
+        response = {
             'success': True,
             'questions': questions,
-            'totalQuestions': total_questions,
             'currentCategory': category_id,
-        })
+            'next': next_page,
+        }
+        if include_total():
+            response['totalQuestions'] = question_counts.total(category_id + 1)
+        return jsonify(response)
 
     @app.route('/questions/<int:question_id>', methods=['DELETE'])
     def delete_question(question_id):
@@ -133,11 +171,25 @@ def create_app(test_config=None):
 
     @app.route('/questions/search', methods=['POST'])
     def search_question():
-        search_term = request.get_json().get('searchTerm')
-        results = Question.query.filter(
-            Question.question.ilike(f'%{search_term}%')).all()
+        # Full-text search over question and answer text, ranked and
+        # paginated; optionally narrowed to a category (numbered as in
+        # /categories/<id>/questions) and a difficulty
+        body = request.get_json() or {}
+        search_term = body.get('searchTerm') or ''
+        try:
+            page = max(int(body.get('page', 1)), 1)
+            per_page = min(max(int(body.get('per_page', QUESTIONS_PER_PAGE)), 1),
+                           MAX_QUESTIONS_PER_PAGE)
+            category = body.get('category')
+            category = None if category is None else int(category) + 1
+            difficulty = body.get('difficulty')
+            difficulty = None if difficulty is None else int(difficulty)
+        except (TypeError, ValueError):
+            abort(400)
+
+        results, total_questions = search_questions(
+            search_term, category, difficulty, page, per_page)
         questions = [question.format() for question in results]
-        total_questions = len(questions)
         if not questions:
             abort(400)
 
@@ -145,9 +197,71 @@ def create_app(test_config=None):
             'success': True,
             'questions': questions,
             'totalQuestions': total_questions,
-            'currentCategory': questions[0]['category'] if total_questions > 0 else 0
+            'currentCategory': questions[0]['category']
+        })
+
+    @app.route('/questions/import', methods=['POST'])
+    def bulk_import_questions():
+        # Streams a CSV or NDJSON question bank, sent either as the "file"
+        # field of a multipart form or as the raw request body, and inserts
+        # it in batches; rows that fail validation are reported by line
+        upload = request.files.get('file')
+        if upload:
+            stream, format = upload.stream, bank_format(upload.filename, upload.mimetype)
+        else:
+            stream, format = request.stream, bank_format(None, request.mimetype)
+        format = request.args.get('format', format)
+        batch_size = request.args.get('batch_size', IMPORT_BATCH_SIZE, type=int)
+        if format not in ('csv', 'ndjson') or batch_size < 1:
+            abort(400)
+
+        report = import_questions(
+            io.TextIOWrapper(stream, encoding='utf-8', newline=''), format, batch_size)
+        return jsonify({
+            'success': True,
+            'inserted': report['inserted'],
+            'errors': report['errors']
         })
 
+    @app.route('/questions/export', methods=['GET'])
+    def bulk_export_questions():
+        # Every question as CSV or NDJSON, streamed while it is read
+        format = request.args.get('format', 'ndjson')
+        if format not in ('csv', 'ndjson'):
+            abort(400)
+        mimetype = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+        return Response(stream_with_context(export_questions(format)), mimetype=mimetype,
+                        headers={'Content-Disposition': 'attachment; filename=questions.' + format})
+
+    @app.cli.command('create-search-index')
+    def create_search_index_command():
+        """Add the full-text search column and index to the questions table."""
+        create_search_index()
+        click.echo('The search index is ready.')
+
+    @app.cli.command('import-questions')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', type=click.Choice(['csv', 'ndjson']), help='Defaults to the file extension.')
+    @click.option('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='Rows per INSERT.')
+    def import_questions_command(path, format, batch_size):
+        """Bulk load questions from a CSV or NDJSON file."""
+        with open(path, encoding='utf-8', newline='') as stream:
+            report = import_questions(stream, format or bank_format(path, None), batch_size)
+        for error in report['errors']:
+            click.echo('line {}: {}'.format(error['line'], error['errors']), err=True)
+        click.echo('Imported {} questions, {} rows rejected.'.format(
+            report['inserted'], len(report['errors'])))
+
+    @app.cli.command('export-questions')
+    @click.argument('path', type=click.Path(dir_okay=False, writable=True))
+    @click.option('--format', type=click.Choice(['csv', 'ndjson']), help='Defaults to the file extension.')
+    def export_questions_command(path, format):
+        """Write every question to a CSV or NDJSON file."""
+        with open(path, 'w', encoding='utf-8', newline='') as stream:
+            for chunk in export_questions(format or bank_format(path, None), EXPORT_BATCH_SIZE):
+                stream.write(chunk)
+        click.echo('Exported the questions to {}.'.format(path))
+
     @app.route('/quizzes', methods=['POST'])
     def play():
         previous_questions = request.get_json().get('previous_questions')
@@ -155,26 +269,26 @@ def create_app(test_config=None):
 
         # This conditional handles when the "ALL" category is picked
         if int(quiz_category['id']) == -1:
-            results = Question.query.all()
+            current_category = None
         else:
             current_category = (int(quiz_category['id']) + 1)
-            results = Question.query.filter(
-                Question.category == current_category).all()
-        if not results:
+        if not question_index.ids(current_category):
             abort(404)
-        all_questions = [r.id for r in results]
-        possible_questions = list(
-            set(all_questions) - set(previous_questions))
-        possible_questions_length = len(possible_questions)
 
-        next_question_index = 0 if possible_questions_length == 0 else randrange(
-            possible_questions_length)
+        # The id is drawn from the in-memory index; only the chosen
+        # question is read, by primary key. A question deleted by another
+        # process since the index was loaded reloads it and draws again.
         next_question = None
-        if possible_questions_length > 0:
-            for r in results:
-                if r.id == possible_questions[next_question_index]:
-                    next_question = r.format()
-                    continue
+        for attempt in range(2):
+            question_id = question_index.pick(
+                current_category, previous_questions or [])
+            if question_id is None:
+                break
+            question = Question.query.get(question_id)
+            if question is not None:
+                next_question = question.format()
+                break
+            question_index.invalidate()
 
         return jsonify({
             'success': True,
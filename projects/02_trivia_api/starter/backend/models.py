@@ -1,5 +1,9 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import random
+import re
+import time
+from threading import Lock
+from sqlalchemy import Column, String, Integer, create_engine, func, literal_column, text
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -18,6 +22,8 @@ def setup_db(app, database_path=database_path):
     db.app = app
     db.init_app(app)
     db.create_all()
+    questions_changed()
+    cached_categories.invalidate()
 
 '''
 Question
@@ -41,13 +47,16 @@ class Question(db.Model):
   def insert(self):
     db.session.add(self)
     db.session.commit()
+    questions_changed()
   
   def update(self):
     db.session.commit()
+    questions_changed()
 
   def delete(self):
     db.session.delete(self)
     db.session.commit()
+    questions_changed()
 
   def format(self):
     return {
@@ -75,4 +84,194 @@ class Category(db.Model):
     return {
       'id': self.id,
       'type': self.type
-    }
\ No newline at end of file
+    }
+'''
+create_search_index()
+    the full-text index over question and answer text: a GIN index on
+    their tsvector on Postgres, or an FTS5 table kept in step with the
+    questions table by triggers on SQLite
+'''
+def create_search_index():
+  # run by "flask create-search-index" rather than on start up: on a large
+  # table adding the column is a long rewrite under an exclusive lock.
+  # Runs on the engine so no session is left bound to it when setup_db() is
+  # called again with another database.
+  with db.engine.begin() as connection:
+    if connection.dialect.name == 'postgresql':
+      # checked first: ALTER TABLE locks the table even when it has nothing to do
+      exists = connection.execute(
+        "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_questions_search_vector'").scalar()
+      if not exists:
+        for statement in POSTGRES_SEARCH_SCHEMA:
+          connection.execute(statement)
+    elif connection.dialect.name == 'sqlite':
+      exists = connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'questions_fts'").scalar()
+      if not exists:
+        for statement in SQLITE_SEARCH_SCHEMA:
+          connection.execute(statement)
+
+# search_vector is stored so ranking a match does not parse its text again;
+# it is left out of the Question model as Postgres computes it
+POSTGRES_SEARCH_SCHEMA = [
+  "ALTER TABLE questions ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS "
+  "(to_tsvector('english', coalesce(question, '') || ' ' || coalesce(answer, ''))) STORED",
+  # the earlier index on the to_tsvector() expression
+  "DROP INDEX IF EXISTS ix_questions_search",
+  "CREATE INDEX IF NOT EXISTS ix_questions_search_vector ON questions USING gin (search_vector)",
+]
+
+SQLITE_SEARCH_SCHEMA = [
+  "CREATE VIRTUAL TABLE questions_fts USING fts5(question, answer, content='questions', content_rowid='id')",
+  "INSERT INTO questions_fts (questions_fts) VALUES ('rebuild')",
+  "CREATE TRIGGER questions_fts_insert AFTER INSERT ON questions BEGIN "
+  "INSERT INTO questions_fts (rowid, question, answer) VALUES (new.id, new.question, new.answer); END",
+  "CREATE TRIGGER questions_fts_delete AFTER DELETE ON questions BEGIN "
+  "INSERT INTO questions_fts (questions_fts, rowid, question, answer) "
+  "VALUES ('delete', old.id, old.question, old.answer); END",
+  "CREATE TRIGGER questions_fts_update AFTER UPDATE ON questions BEGIN "
+  "INSERT INTO questions_fts (questions_fts, rowid, question, answer) "
+  "VALUES ('delete', old.id, old.question, old.answer); "
+  "INSERT INTO questions_fts (rowid, question, answer) VALUES (new.id, new.question, new.answer); END",
+]
+
+'''
+search_questions(search_term, category=None, difficulty=None, page=1, per_page=10)
+    one page of the questions whose question or answer text has every
+    word of search_term (a word also matches as a prefix), best matches
+    first, and the number of matches. Every match is ranked and counted;
+    only the rows of the page are loaded.
+'''
+def search_questions(search_term, category=None, difficulty=None, page=1, per_page=10):
+  words = re.findall(r'\w+', search_term.lower())
+  if not words:
+    return [], 0
+
+  if db.engine.dialect.name == 'postgresql':
+    search_vector = literal_column('questions.search_vector')
+    terms = func.to_tsquery(literal_column("'english'"), ' & '.join(word + ':*' for word in words))
+    # lowest first, as bm25
+    matches = db.session.query(Question.id, (-func.ts_rank(search_vector, terms)).label('rank')) \
+      .filter(search_vector.op('@@')(terms))
+  else:
+    fts = db.table('questions_fts', db.column('rowid'))
+    matches = db.session.query(Question.id, func.bm25(literal_column('questions_fts')).label('rank')) \
+      .join(fts, fts.c.rowid == Question.id) \
+      .filter(text('questions_fts MATCH :terms').bindparams(
+        terms=' AND '.join('"%s"*' % word for word in words)))
+  if category is not None:
+    matches = matches.filter(Question.category == category)
+  if difficulty is not None:
+    matches = matches.filter(Question.difficulty == difficulty)
+  matches = matches.subquery()
+
+  # rank and count every match, then load the rows of one page
+  page_ids = db.session.query(matches.c.id, matches.c.rank,
+                              func.count().over().label('total')) \
+    .order_by(matches.c.rank, matches.c.id) \
+    .limit(per_page).offset((page - 1) * per_page).subquery()
+  rows = db.session.query(Question, page_ids.c.total) \
+    .join(page_ids, page_ids.c.id == Question.id) \
+    .order_by(page_ids.c.rank, Question.id).all()
+  return [question for question, total in rows], rows[0][1] if rows else 0
+
+'''
+LoadedCache
+    the value returned by load(), built on first use and kept until
+    invalidate() is called or it is older than max_age seconds, so writes
+    made by other processes are picked up
+'''
+class LoadedCache:
+  def __init__(self, load, max_age=60):
+    self.load = load
+    self.max_age = max_age
+    self._lock = Lock()
+    self._value = None
+    self._loaded_at = 0
+
+  def get(self):
+    with self._lock:
+      if self._value is None or time.monotonic() - self._loaded_at > self.max_age:
+        self._value = self.load()
+        self._loaded_at = time.monotonic()
+      return self._value
+
+  def invalidate(self):
+    with self._lock:
+      self._value = None
+
+'''
+QuestionIndex
+    question ids per category, kept in memory so a quiz turn draws its
+    question without loading any rows. Loaded with one query on first use
+    and again after Question.insert(), update() or delete().
+'''
+class QuestionIndex:
+  def __init__(self, max_age=60):
+    self._ids = LoadedCache(self._load, max_age)
+
+  def invalidate(self):
+    self._ids.invalidate()
+
+  def ids(self, category=None):
+    '''ids of the questions in category (all questions for None)'''
+    return self._ids.get().get(None if category is None else str(category), [])
+
+  def pick(self, category=None, exclude=()):
+    '''a random id from category that is not in exclude, or None'''
+    ids = self.ids(category)
+    exclude = set(exclude)
+    if len(exclude) * 2 < len(ids):
+      # most ids are allowed, so a couple of draws are expected
+      while True:
+        question_id = random.choice(ids)
+        if question_id not in exclude:
+          return question_id
+    remaining = [question_id for question_id in ids if question_id not in exclude]
+    return random.choice(remaining) if remaining else None
+
+  def _load(self):
+    ids = {None: []}
+    for question_id, category in db.session.query(Question.id, Question.category):
+      ids[None].append(question_id)
+      ids.setdefault(str(category), []).append(question_id)
+    return ids
+
+'''
+QuestionCounts
+    number of questions per category, from one COUNT(*) ... GROUP BY,
+    reused until questions are inserted or deleted
+'''
+class QuestionCounts:
+  def __init__(self, max_age=60):
+    self._counts = LoadedCache(self._load, max_age)
+
+  def invalidate(self):
+    self._counts.invalidate()
+
+  def total(self, category=None):
+    '''number of questions in category (all questions for None)'''
+    return self._counts.get().get(None if category is None else str(category), 0)
+
+  def _load(self):
+    counts = {None: 0}
+    for category, count in db.session.query(Question.category, func.count()).group_by(Question.category):
+      counts[str(category)] = count
+      counts[None] += count
+    return counts
+
+def load_categories():
+  return [category.format() for category in Category.query.order_by(Category.id).all()]
+
+question_index = QuestionIndex()
+question_counts = QuestionCounts()
+# the categories only change with the database
+cached_categories = LoadedCache(load_categories, max_age=300)
+
+'''
+questions_changed()
+    drops what is cached about the questions table
+'''
+def questions_changed():
+  question_index.invalidate()
+  question_counts.invalidate()
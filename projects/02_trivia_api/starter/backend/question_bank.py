@@ -0,0 +1,156 @@
+import csv
+import io
+import json
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Question, cached_categories, questions_changed
+
+IMPORT_BATCH_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+DIFFICULTIES = range(1, 6)
+FIELDS = ['id', 'question', 'answer', 'category', 'difficulty']
+
+'''
+csv_questions(stream)
+    (line, row, error) for each record of a CSV question bank whose first
+    line names the columns; header names are matched case-insensitively
+'''
+def csv_questions(stream):
+  reader = csv.reader(stream)
+  header = [name.strip().lower() for name in next(reader, [])]
+  for record in reader:
+    if not any(value.strip() for value in record):
+      continue
+    if len(record) != len(header):
+      yield reader.line_num, None, 'Expected %d columns, found %d' % (len(header), len(record))
+    else:
+      yield reader.line_num, dict(zip(header, record)), None
+
+'''
+ndjson_questions(stream)
+    (line, row, error) for each line of an NDJSON question bank, one JSON
+    object per line; blank lines are skipped
+'''
+def ndjson_questions(stream):
+  for line, text in enumerate(stream, 1):
+    if not text.strip():
+      continue
+    try:
+      row = json.loads(text)
+    except ValueError as e:
+      yield line, None, str(e)
+      continue
+    if isinstance(row, dict):
+      yield line, row, None
+    else:
+      yield line, None, 'Expected a JSON object'
+
+READERS = {'csv': csv_questions, 'ndjson': ndjson_questions}
+
+def to_int(value):
+  # whole numbers, or strings of one as read from CSV; None otherwise
+  if isinstance(value, bool):
+    return None
+  if isinstance(value, int):
+    return value
+  if isinstance(value, str) and value.strip().isdigit():
+    return int(value)
+  return None
+
+'''
+validate_question(row, category_ids)
+    (values, errors) for one imported row: question and answer must be
+    given, category must be the id of an existing category (as listed by
+    /categories) and difficulty between 1 and 5. Other keys, such as the
+    id of an export, are ignored.
+'''
+def validate_question(row, category_ids):
+  values, errors = {}, {}
+  for field in ('question', 'answer'):
+    value = row.get(field)
+    if isinstance(value, str) and value.strip():
+      values[field] = value.strip()
+    else:
+      errors[field] = 'This field is required.'
+  values['category'] = to_int(row.get('category'))
+  if values['category'] not in category_ids:
+    errors['category'] = 'Not an existing category id.'
+  values['difficulty'] = to_int(row.get('difficulty'))
+  if values['difficulty'] not in DIFFICULTIES:
+    errors['difficulty'] = 'Must be a whole number from 1 to 5.'
+  if errors:
+    return None, errors
+  return values, None
+
+'''
+import_questions(stream, format, batch_size=IMPORT_BATCH_SIZE)
+    reads a CSV or NDJSON question bank and inserts its valid rows with
+    one INSERT and commit per batch_size rows, so memory use does not grow
+    with the file. Returns {"inserted", "errors"}, with the errors of each
+    rejected row by line number.
+'''
+def import_questions(stream, format, batch_size=IMPORT_BATCH_SIZE):
+  category_ids = {category['id'] for category in cached_categories.get()}
+  report = {'inserted': 0, 'errors': []}
+  batch = []
+  try:
+    for line, row, error in READERS[format](stream):
+      if row is not None:
+        values, error = validate_question(row, category_ids)
+      if error:
+        report['errors'].append({'line': line, 'errors': error})
+        continue
+      batch.append((line, values))
+      if len(batch) >= batch_size:
+        insert_batch(batch, report)
+        batch = []
+    if batch:
+      insert_batch(batch, report)
+  finally:
+    # batches committed before a failure are kept
+    if report['inserted']:
+      questions_changed()
+  return report
+
+def insert_batch(batch, report):
+  # rows are checked against all the questions table enforces, so a
+  # rejected batch means the database failed: its rows are reported with
+  # the error and the import goes on with the next batch
+  try:
+    db.session.execute(Question.__table__.insert(), [values for line, values in batch])
+    db.session.commit()
+    report['inserted'] += len(batch)
+  except SQLAlchemyError as e:
+    db.session.rollback()
+    message = str(getattr(e, 'orig', e))
+    report['errors'].extend({'line': line, 'errors': message} for line, values in batch)
+
+'''
+export_questions(format, batch_size=EXPORT_BATCH_SIZE)
+    the questions table as CSV or NDJSON text in id order, one chunk per
+    batch_size rows. Rows are read from a server-side cursor, so neither
+    the rows nor the output are ever held in memory at once.
+'''
+def export_questions(format, batch_size=EXPORT_BATCH_SIZE):
+  query = db.session.query(*[getattr(Question, field) for field in FIELDS]) \
+    .order_by(Question.id).yield_per(batch_size)
+  chunk = io.StringIO()
+  writer = csv.writer(chunk, lineterminator='\n') if format == 'csv' else None
+  if writer:
+    writer.writerow(FIELDS)
+  for count, row in enumerate(query, 1):
+    if writer:
+      writer.writerow(row)
+    else:
+      chunk.write(json.dumps(dict(zip(FIELDS, row))) + '\n')
+    if count % batch_size == 0:
+      yield chunk.getvalue()
+      chunk.seek(0)
+      chunk.truncate()
+  if chunk.tell():
+    yield chunk.getvalue()
+
+def bank_format(filename, mimetype):
+  if (filename or '').endswith('.csv') or mimetype == 'text/csv':
+    return 'csv'
+  return 'ndjson'
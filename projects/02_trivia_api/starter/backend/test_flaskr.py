@@ -1,10 +1,13 @@
 import os
+import io
+import csv
+import tempfile
 import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from models import setup_db, db, Question, Category, questions_changed, create_search_index
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -14,6 +17,7 @@ class TriviaTestCase(unittest.TestCase):
         self.database_path = "postgres://{}/{}".format(
             'postgres:1234@localhost:5432', database_name)
         setup_db(self.app, self.database_path)
+        create_search_index()
 
     def setUp(self):
         """Define test variables and initialize app."""
@@ -91,6 +95,65 @@ class TriviaTestCase(unittest.TestCase):
         self.assertGreaterEqual(data['currentCategory'], 0)
 
 
+    def test_total_questions_follow_writes(self):
+        with self.app.app_context():
+            total = Question.query.count()
+        data = json.loads(self.client().get('/questions').data)
+        self.assertEqual(data['totalQuestions'], total)
+        self.assertEqual(len(data['categories']), 6)
+
+        self.client().post('/questions/add', json=self.test_question)
+        data = json.loads(self.client().get('/questions').data)
+        self.assertEqual(data['totalQuestions'], total + 1)
+        with self.app.app_context():
+            question_id = Question.query.order_by(Question.id.desc()).first().id
+        self.client().delete('/questions/' + str(question_id))
+        data = json.loads(self.client().get('/questions').data)
+        self.assertEqual(data['totalQuestions'], total)
+
+    def test_question_by_category_total(self):
+        with self.app.app_context():
+            total = Question.query.filter(Question.category == 4).count()
+            for i in range(12):
+                Question('History question %d' % i, 'Answer', 4, 1).insert()
+        data = json.loads(self.client().get('/categories/3/questions').data)
+        self.assertEqual(len(data['questions']), 10)
+        self.assertEqual(data['totalQuestions'], total + 12)
+        with self.app.app_context():
+            for question in Question.query.filter(
+                    Question.question.like('History question %')).all():
+                question.delete()
+
+    def test_get_questions_with_cursor(self):
+        with self.app.app_context():
+            ids = [q.id for q in Question.query.order_by(Question.id).all()]
+        seen = []
+        url = '/questions?per_page=4&total=false'
+        while url:
+            data = json.loads(self.client().get(url).data)
+            self.assertNotIn('totalQuestions', data)
+            seen.extend(q['id'] for q in data['questions'])
+            url = data['next'] and '/questions?per_page=4&total=false&after=' + data['next']
+        self.assertEqual(seen, ids)
+
+        data = json.loads(self.client().get('/questions?per_page=4&page=2').data)
+        self.assertEqual([q['id'] for q in data['questions']], ids[4:8])
+        self.assertEqual(data['totalQuestions'], len(ids))
+
+    def test_get_questions_page_size_clamped(self):
+        with self.app.app_context():
+            total = Question.query.count()
+        data = json.loads(self.client().get('/questions?per_page=1000').data)
+        self.assertEqual(len(data['questions']), min(total, 100))
+        data = json.loads(self.client().get('/questions?per_page=0').data)
+        self.assertEqual(len(data['questions']), 1)
+
+    def test_get_questions_bad_cursor(self):
+        res = self.client().get('/questions?after=not-a-cursor')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(data['success'])
+
     def test_get_question_by_category_not_found(self):
         res = self.client().get('/categories/100/questions')
         data = json.loads(res.data)
@@ -138,6 +201,76 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 400)
         self.assertFalse(data['success'])
 
+    def test_search_question_ranked_and_filtered(self):
+        with self.app.app_context():
+            for i in range(3):
+                Question('Which planet has rings number %d?' % i, 'Saturn', 5, i + 1).insert()
+        res = self.client().post('/questions/search', json={
+            'searchTerm': 'PLAN ring', 'per_page': 2})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['totalQuestions'], 3)
+        self.assertEqual(len(data['questions']), 2)
+
+        res = self.client().post('/questions/search', json={
+            'searchTerm': 'saturn', 'category': 4, 'difficulty': 2})
+        data = json.loads(res.data)
+        self.assertEqual([q['difficulty'] for q in data['questions']], [2])
+        res = self.client().post('/questions/search', json={
+            'searchTerm': 'saturn', 'category': 0})
+        self.assertEqual(res.status_code, 400)
+
+        with self.app.app_context():
+            for question in Question.query.filter(Question.answer == 'Saturn').all():
+                question.delete()
+
+    def test_search_question_ranks_every_match(self):
+        # more matches than a page of ids, the best one inserted last
+        with self.app.app_context():
+            db.session.execute(Question.__table__.insert(), [
+                {'question': 'Name a moon number %d' % i, 'answer': 'Io',
+                 'category': 1, 'difficulty': 1} for i in range(1500)])
+            db.session.commit()
+            Question('Which moon orbits the moon planet, moon?', 'Moon', 1, 1).insert()
+        try:
+            res = self.client().post('/questions/search', json={'searchTerm': 'moon'})
+            data = json.loads(res.data)
+            self.assertEqual(data['totalQuestions'], 1501)
+            self.assertEqual(data['questions'][0]['answer'], 'Moon')
+        finally:
+            with self.app.app_context():
+                Question.query.filter(Question.question.like('%moon%')).delete(synchronize_session=False)
+                db.session.commit()
+                questions_changed()
+
+    def test_create_search_index_command(self):
+        # idempotent, so it can be run on every deploy
+        for attempt in range(2):
+            result = self.app.test_cli_runner().invoke(args=['create-search-index'])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertIn('The search index is ready.', result.output)
+
+    def test_search_question_sqlite(self):
+        # the FTS5 fallback used without Postgres
+        setup_db(self.app, 'sqlite://')
+        create_search_index()
+        try:
+            with self.app.app_context():
+                Question('Who painted the Mona Lisa?', 'Leonardo', 2, 3).insert()
+                Question('Which painter cut off an ear?', 'Van Gogh', 2, 2).insert()
+                Question('What is the boiling point of water?', '100', 1, 1).insert()
+            res = self.client().post('/questions/search', json={'searchTerm': 'paint'})
+            data = json.loads(res.data)
+            self.assertEqual(data['totalQuestions'], 2)
+            res = self.client().post('/questions/search', json={
+                'searchTerm': 'van', 'difficulty': 2})
+            data = json.loads(res.data)
+            self.assertEqual(data['questions'][0]['answer'], 'Van Gogh')
+            res = self.client().post('/questions/search', json={'searchTerm': 'Star Trek'})
+            self.assertEqual(res.status_code, 400)
+        finally:
+            self.setUpDatabase(self.database_name)
+
     def test_play(self):
         res = self.client().post(
             '/quizzes',
@@ -153,6 +286,132 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['success'])
         self.assertTrue(data['question'])
 
+    def play_category(self, category_id, previous_questions):
+        res = self.client().post(
+            '/quizzes',
+            json={
+                'previous_questions': previous_questions,
+                'quiz_category': {'id': category_id}
+                })
+        return res.status_code, json.loads(res.data)
+
+    def test_play_skips_previous_questions(self):
+        with self.app.app_context():
+            ids = [q.id for q in Question.query.filter(
+                Question.category == 1).all()]
+        for _ in range(10):
+            status, data = self.play_category('0', ids[1:])
+            self.assertEqual(status, 200)
+            self.assertEqual(data['question']['id'], ids[0])
+
+        status, data = self.play_category('0', ids)
+        self.assertEqual(status, 200)
+        self.assertIsNone(data['question'])
+
+    def test_play_includes_new_question(self):
+        with self.app.app_context():
+            ids = [q.id for q in Question.query.all()]
+        self.play_category(-1, [])
+        self.client().post('/questions/add', json=self.test_question)
+
+        status, data = self.play_category(-1, ids)
+        self.assertEqual(status, 200)
+        self.assertEqual(data['question']['question'], self.test_question['question'])
+        self.client().delete('/questions/' + str(data['question']['id']))
+        status, data = self.play_category(-1, ids)
+        self.assertIsNone(data['question'])
+
+    def test_play_category_not_found(self):
+        status, data = self.play_category('100', [])
+        self.assertEqual(status, 404)
+        self.assertFalse(data['success'])
+
+    def delete_imported(self):
+        with self.app.app_context():
+            for question in Question.query.filter(
+                    Question.question.like('Imported question %')).all():
+                question.delete()
+
+    def test_import_questions_ndjson(self):
+        with self.app.app_context():
+            total = Question.query.count()
+        lines = [json.dumps({'question': 'Imported question %d' % i, 'answer': 'Answer',
+                             'category': 1, 'difficulty': 2}) for i in range(5)]
+        lines.insert(2, json.dumps({'question': 'Imported question x', 'answer': 'Answer',
+                                    'category': 100, 'difficulty': 9}))
+        lines.insert(4, '{not json')
+        try:
+            res = self.client().post('/questions/import?batch_size=2', data='\n'.join(lines),
+                                     content_type='application/x-ndjson')
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(data['inserted'], 5)
+            self.assertEqual([error['line'] for error in data['errors']], [3, 5])
+            self.assertEqual(sorted(data['errors'][0]['errors']), ['category', 'difficulty'])
+            data = json.loads(self.client().get('/questions').data)
+            self.assertEqual(data['totalQuestions'], total + 5)
+        finally:
+            self.delete_imported()
+
+    def test_import_questions_csv_file(self):
+        upload = 'question,answer,category,difficulty\n' \
+            'Imported question 1,Answer,2,3\n' \
+            ',Answer,2,3\n' \
+            'Imported question 2,Answer\n'
+        try:
+            res = self.client().post('/questions/import', data={
+                'file': (io.BytesIO(upload.encode()), 'questions.csv')})
+            data = json.loads(res.data)
+            self.assertEqual(data['inserted'], 1)
+            self.assertEqual(data['errors'], [
+                {'line': 3, 'errors': {'question': 'This field is required.'}},
+                {'line': 4, 'errors': 'Expected 4 columns, found 2'}])
+            with self.app.app_context():
+                question = Question.query.filter_by(question='Imported question 1').one()
+                self.assertEqual((int(question.category), question.difficulty), (2, 3))
+        finally:
+            self.delete_imported()
+
+    def test_import_questions_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as f:
+            f.write(json.dumps({'question': 'Imported question 1', 'answer': 'Answer',
+                                'category': '4', 'difficulty': '1'}) + '\n')
+        try:
+            result = self.app.test_cli_runner().invoke(args=['import-questions', f.name])
+            self.assertIn('Imported 1 questions, 0 rows rejected.', result.output)
+        finally:
+            os.remove(f.name)
+            self.delete_imported()
+
+    def test_export_questions(self):
+        with self.app.app_context():
+            total = Question.query.count()
+        res = self.client().get('/questions/export')
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        rows = [json.loads(line) for line in res.data.decode().splitlines()]
+        self.assertEqual(len(rows), total)
+        self.assertEqual([row['id'] for row in rows], sorted(row['id'] for row in rows))
+
+        res = self.client().get('/questions/export?format=csv')
+        rows = list(csv.DictReader(io.StringIO(res.data.decode())))
+        self.assertEqual(len(rows), total)
+        self.assertEqual(sorted(rows[0]), ['answer', 'category', 'difficulty', 'id', 'question'])
+
+        # an export imports back unchanged, its ids ignored
+        upload = io.StringIO()
+        writer = csv.DictWriter(upload, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerow(dict(rows[0], question='Imported question 1'))
+        try:
+            res = self.client().post('/questions/import?format=csv', data=upload.getvalue())
+            self.assertEqual(json.loads(res.data)['inserted'], 1)
+        finally:
+            self.delete_imported()
+
+    def test_export_questions_bad_format(self):
+        res = self.client().get('/questions/export?format=xml')
+        self.assertEqual(res.status_code, 400)
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
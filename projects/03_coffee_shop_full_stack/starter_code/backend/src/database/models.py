@@ -3,6 +3,11 @@ from sqlalchemy import Column, String, Integer
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+try:
+    from query_profiler import QueryProfiler
+except ImportError:
+    QueryProfiler = None
+
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
 database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
@@ -19,6 +24,8 @@ def setup_db(app):
     app.config["CORS_SUPPORTS_CREDENTIALS"] = True
     db.app = app
     db.init_app(app)
+    if QueryProfiler is not None:
+        QueryProfiler(app)
 
 '''
 db_drop_and_create_all()
@@ -0,0 +1,125 @@
+import json
+import time
+from collections import Counter
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class RequestProfile(object):
+    '''
+    RequestProfile
+        the statements one request sent to the database, with their timings
+    '''
+
+    def __init__(self):
+        self.statements = Counter()
+        self.count = 0
+        self.time = 0.0
+
+    def record(self, statement, elapsed):
+        self.statements[statement] += 1
+        self.count += 1
+        self.time += elapsed
+
+    def repeated(self, threshold):
+        # identical statements run threshold times or more: usually a query
+        # issued once per row of an earlier result (N+1)
+        return [(statement, count) for statement, count in self.statements.most_common()
+                if count >= threshold]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context() and g.get('_sql_profile') is not None:
+        conn.info.setdefault('_sql_profiler_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('_sql_profiler_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    if has_app_context() and g.get('_sql_profile') is not None:
+        g._sql_profile.record(statement, elapsed)
+
+
+def _handle_error(context):
+    # a failed statement gets no after_cursor_execute
+    starts = context.connection.info.get('_sql_profiler_start') if context.connection else None
+    if starts:
+        starts.pop()
+
+
+class QueryProfiler(object):
+    '''
+    QueryProfiler
+        counts and times the SQL statements of every request and flags
+        statements repeated within a request. Results are sent as
+        X-SQL-* and Server-Timing response headers and logged as one JSON
+        line per request. Works with any SQLAlchemy engine in the process.
+
+        Settings (app.config):
+            SQL_PROFILER_ENABLED            profile requests (True)
+            SQL_PROFILER_HEADERS            add the response headers (True)
+            SQL_PROFILER_LOG                log each request (True)
+            SQL_PROFILER_REPEAT_THRESHOLD   runs of one statement that
+                                            count as repeated (3)
+    '''
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_PROFILER_ENABLED', True)
+        app.config.setdefault('SQL_PROFILER_HEADERS', True)
+        app.config.setdefault('SQL_PROFILER_LOG', True)
+        app.config.setdefault('SQL_PROFILER_REPEAT_THRESHOLD', 3)
+
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.extensions['query_profiler'] = self
+
+    def _start(self):
+        if current_app.config['SQL_PROFILER_ENABLED']:
+            g._sql_profile = RequestProfile()
+
+    def _finish(self, response):
+        # Statements run while a streamed body is generated come after this
+        # point and are not included
+        profile = g.pop('_sql_profile', None)
+        if profile is None:
+            return response
+        config = current_app.config
+        time_ms = round(profile.time * 1000, 3)
+        repeated = profile.repeated(config['SQL_PROFILER_REPEAT_THRESHOLD'])
+
+        if config['SQL_PROFILER_HEADERS']:
+            response.headers['X-SQL-Queries'] = str(profile.count)
+            response.headers['X-SQL-Time-Ms'] = str(time_ms)
+            response.headers['X-SQL-Repeated'] = str(len(repeated))
+            response.headers.add('Server-Timing', 'db;dur={};desc="{} queries"'.format(
+                time_ms, profile.count))
+
+        if config['SQL_PROFILER_LOG']:
+            line = json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'queries': profile.count,
+                'time_ms': time_ms,
+                'repeated': [{'statement': statement, 'count': count}
+                             for statement, count in repeated],
+            })
+            if repeated:
+                current_app.logger.warning('sql_profile %s', line)
+            else:
+                current_app.logger.info('sql_profile %s', line)
+        return response
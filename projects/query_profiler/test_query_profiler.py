@@ -0,0 +1,73 @@
+import logging
+import unittest
+
+from flask import Flask, jsonify
+from flask_sqlalchemy import SQLAlchemy
+
+from query_profiler import QueryProfiler
+
+
+class QueryProfilerTestCase(unittest.TestCase):
+    """This class represents the query profiler test case"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app.config['TESTING'] = True
+        db = SQLAlchemy(self.app)
+        QueryProfiler(self.app)
+
+        @self.app.route('/one')
+        def one():
+            return jsonify(db.session.execute('SELECT 1').scalar())
+
+        @self.app.route('/many')
+        def many():
+            return jsonify([db.session.execute('SELECT :n', {'n': n}).scalar() for n in range(5)])
+
+        @self.app.route('/error')
+        def error():
+            try:
+                db.session.execute('SELECT * FROM missing')
+            except Exception:
+                pass
+            return jsonify(db.session.execute('SELECT 1').scalar())
+
+        self.client = self.app.test_client
+
+    def test_headers(self):
+        res = self.client().get('/one')
+        self.assertEqual(res.headers['X-SQL-Queries'], '1')
+        self.assertEqual(res.headers['X-SQL-Repeated'], '0')
+        self.assertGreaterEqual(float(res.headers['X-SQL-Time-Ms']), 0)
+        self.assertIn('db;dur=', res.headers['Server-Timing'])
+
+    def test_repeated_statements(self):
+        with self.assertLogs(self.app.logger, logging.WARNING) as logs:
+            res = self.client().get('/many')
+        self.assertEqual(res.headers['X-SQL-Queries'], '5')
+        self.assertEqual(res.headers['X-SQL-Repeated'], '1')
+        self.assertIn('"count": 5', logs.output[0])
+        self.assertIn('"path": "/many"', logs.output[0])
+
+    def test_failed_statement(self):
+        res = self.client().get('/error')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['X-SQL-Queries'], '1')
+
+    def test_disabled(self):
+        self.app.config['SQL_PROFILER_ENABLED'] = False
+        res = self.client().get('/one')
+        self.assertNotIn('X-SQL-Queries', res.headers)
+
+    def test_outside_requests(self):
+        with self.app.app_context():
+            self.app.extensions['sqlalchemy'].db.session.execute('SELECT 1')
+        res = self.client().get('/one')
+        self.assertEqual(res.headers['X-SQL-Queries'], '1')
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()